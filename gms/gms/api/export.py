@@ -0,0 +1,161 @@
+import csv
+import io
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint, getdate
+from frappe.utils.response import json_handler
+from werkzeug.wrappers import Response
+
+DEFAULT_CHUNK_SIZE = 1000
+
+# Exportable doctypes with their date column, default columns and allowed filters
+EXPORTS = {
+	"Gym Visit": {
+		"date_field": "visit_date",
+		"fields": [
+			"name", "member", "visit_date", "check_in_time", "check_out_time",
+			"duration_minutes", "visit_type", "trainer"
+		],
+		"filters": ["member", "visit_type", "trainer"]
+	},
+	"Gym Class Booking": {
+		"date_field": "class_date",
+		"fields": [
+			"name", "member", "gym_class", "class_date", "class_time", "status",
+			"booking_date", "payment_status", "amount_paid", "currency"
+		],
+		"filters": ["member", "gym_class", "status"]
+	}
+}
+
+
+def iter_rows(doctype, fields=None, start_date=None, end_date=None, filters=None, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Yield chunks of rows of an exportable doctype in primary key order
+	
+	Each chunk is fetched with its own keyset query (``name > last name``), so
+	only one chunk is held in memory regardless of how large the range is.
+	"""
+	export = EXPORTS[doctype]
+	fields = _get_fields(doctype, fields)
+	table = frappe.qb.DocType(doctype)
+	
+	query = frappe.qb.from_(table).select(*(table[f] for f in fields)).orderby(table.name).limit(chunk_size)
+	if start_date:
+		query = query.where(table[export["date_field"]] >= getdate(start_date))
+	if end_date:
+		query = query.where(table[export["date_field"]] <= getdate(end_date))
+	for field, value in (filters or {}).items():
+		if value:
+			query = query.where(table[field] == value)
+	
+	last_name = None
+	while True:
+		chunk_query = query if last_name is None else query.where(table.name > last_name)
+		rows = chunk_query.run(as_dict=True)
+		if not rows:
+			return
+		
+		yield rows
+		
+		if len(rows) < chunk_size:
+			return
+		last_name = rows[-1].name
+
+
+def _get_fields(doctype, fields=None):
+	"""Validate requested columns, always keeping ``name`` first for keyset paging"""
+	if not fields:
+		return EXPORTS[doctype]["fields"]
+	
+	if isinstance(fields, str):
+		fields = [f.strip() for f in fields.split(",") if f.strip()]
+	
+	valid_columns = set(frappe.get_meta(doctype).get_valid_columns())
+	invalid = [f for f in fields if f not in valid_columns]
+	if invalid:
+		frappe.throw(_("Invalid fields for {0}: {1}").format(doctype, ", ".join(invalid)))
+	
+	return ["name", *(f for f in fields if f != "name")]
+
+
+def _encode(chunks, fields, export_format):
+	if export_format == "ndjson":
+		for rows in chunks:
+			yield "".join(json.dumps(row, default=json_handler) + "\n" for row in rows)
+		return
+	
+	buffer = io.StringIO()
+	writer = csv.writer(buffer)
+	writer.writerow(fields)
+	for rows in chunks:
+		writer.writerows([row.get(f) for f in fields] for row in rows)
+		yield buffer.getvalue()
+		buffer.seek(0)
+		buffer.truncate(0)
+	
+	if buffer.tell():
+		yield buffer.getvalue()
+
+
+def stream_export(doctype, fields=None, start_date=None, end_date=None, filters=None, export_format="csv", chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Build a streamed CSV or NDJSON response for an exportable doctype"""
+	frappe.has_permission(doctype, "read", throw=True)
+	
+	export_format = (export_format or "csv").lower()
+	if export_format not in ("csv", "ndjson"):
+		frappe.throw(_("Export format must be csv or ndjson"))
+	
+	fields = _get_fields(doctype, fields)
+	filters = {k: v for k, v in (filters or {}).items() if k in EXPORTS[doctype]["filters"]}
+	chunk_size = min(max(cint(chunk_size) or DEFAULT_CHUNK_SIZE, 1), 10000)
+	site, user = frappe.local.site, frappe.session.user
+	
+	def generate():
+		# The request context is torn down before a streamed body is iterated,
+		# so the rows are read over a connection owned by the generator
+		frappe.init(site=site)
+		try:
+			frappe.connect()
+			frappe.set_user(user)
+			chunks = iter_rows(doctype, fields, start_date, end_date, filters, chunk_size)
+			yield from _encode(chunks, fields, export_format)
+		finally:
+			frappe.destroy()
+	
+	filename = f"{frappe.scrub(doctype)}.{export_format}"
+	mimetype = "application/x-ndjson" if export_format == "ndjson" else "text/csv"
+	return Response(
+		generate(),
+		mimetype=mimetype,
+		headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+	)
+
+
+@frappe.whitelist()
+def export_visits(start_date=None, end_date=None, fields=None, format="csv", member=None, visit_type=None, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Stream Gym Visit rows as CSV or NDJSON"""
+	return stream_export(
+		"Gym Visit",
+		fields,
+		start_date,
+		end_date,
+		{"member": member, "visit_type": visit_type},
+		format,
+		chunk_size
+	)
+
+
+@frappe.whitelist()
+def export_bookings(start_date=None, end_date=None, fields=None, format="csv", member=None, gym_class=None, status=None, chunk_size=DEFAULT_CHUNK_SIZE):
+	"""Stream Gym Class Booking rows as CSV or NDJSON"""
+	return stream_export(
+		"Gym Class Booking",
+		fields,
+		start_date,
+		end_date,
+		{"member": member, "gym_class": gym_class, "status": status},
+		format,
+		chunk_size
+	)
@@ -1,8 +1,22 @@
 import frappe
 from frappe import _
-from frappe.utils import today, now_datetime, add_days
+from frappe.utils import cint, today, now_datetime, add_days, date_diff, getdate
 from frappe.model.document import Document
 
+from gms.gms.doctype.gym_booking_request.gym_booking_request import get_request_status
+from gms.gms.doctype.gym_class.gym_class import get_cached_class_availability
+from gms.gms.doctype.gym_class_booking.gym_class_booking import (
+	book_class as book_gym_class,
+	book_series,
+)
+from gms.gms.doctype.gym_visit.gym_visit import (
+	AlreadyCheckedInError,
+	MembershipNotValidError,
+	VisitLimitReachedError,
+	check_in,
+	get_open_visit,
+)
+
 
 @frappe.whitelist()
 def get_member_profile(member_id):
@@ -123,33 +137,17 @@ def get_member_statistics(member_id):
 @frappe.whitelist()
 def check_in_member(member_id, visit_type="Regular Workout"):
 	"""Check in a member to the gym"""
-	# Validate member
-	member = frappe.get_doc("Gym Member", member_id)
-	if not member.is_membership_valid():
+	try:
+		visit = check_in(member_id, visit_type)
+	except MembershipNotValidError:
+		frappe.clear_last_message()
 		return {"status": "error", "message": "Membership is not valid"}
-	
-	# Check if already checked in today
-	existing_visit = frappe.get_all(
-		"Gym Visit",
-		filters={
-			"member": member_id,
-			"visit_date": today(),
-			"check_out_time": ["is", "not set"]
-		}
-	)
-	
-	if existing_visit:
+	except AlreadyCheckedInError:
+		frappe.clear_last_message()
 		return {"status": "error", "message": "Already checked in today"}
-	
-	# Create visit record
-	visit = frappe.get_doc({
-		"doctype": "Gym Visit",
-		"member": member_id,
-		"visit_date": today(),
-		"check_in_time": now_datetime().time(),
-		"visit_type": visit_type
-	})
-	visit.insert()
+	except VisitLimitReachedError:
+		frappe.clear_last_message()
+		return {"status": "error", "message": "Monthly visit limit reached"}
 	
 	return {
 		"status": "success", 
@@ -162,21 +160,11 @@ def check_in_member(member_id, visit_type="Regular Workout"):
 @frappe.whitelist()
 def check_out_member(member_id):
 	"""Check out a member from the gym"""
-	# Find active visit
-	visit = frappe.get_all(
-		"Gym Visit",
-		filters={
-			"member": member_id,
-			"visit_date": today(),
-			"check_out_time": ["is", "not set"]
-		},
-		limit=1
-	)
-	
+	visit = get_open_visit(member_id)
 	if not visit:
 		return {"status": "error", "message": "No active visit found"}
 	
-	visit_doc = frappe.get_doc("Gym Visit", visit[0].name)
+	visit_doc = frappe.get_doc("Gym Visit", visit)
 	visit_doc.check_out()
 	
 	return {
@@ -188,65 +176,26 @@ def check_out_member(member_id):
 
 
 @frappe.whitelist()
-def book_class(member_id, class_name, class_date, class_time):
-	"""Book a class for a member"""
-	# Validate member
-	member = frappe.get_doc("Gym Member", member_id)
-	if not member.is_membership_valid():
-		return {"status": "error", "message": "Membership is not valid"}
-	
-	# Get class details
-	class_doc = frappe.get_doc("Gym Class", class_name)
-	
-	# Check if class exists and is active
-	if not class_doc.is_active:
-		return {"status": "error", "message": "Class is not active"}
-	
-	# Check capacity
-	existing_bookings = frappe.get_all(
-		"Gym Class Booking",
-		filters={
-			"gym_class": class_name,
-			"class_date": class_date,
-			"class_time": class_time,
-			"status": "Confirmed"
-		}
-	)
-	
-	if len(existing_bookings) >= class_doc.max_capacity:
-		return {"status": "error", "message": "Class is fully booked"}
-	
-	# Check if member already booked this class
-	existing_booking = frappe.get_all(
-		"Gym Class Booking",
-		filters={
-			"member": member_id,
-			"gym_class": class_name,
-			"class_date": class_date,
-			"class_time": class_time
-		}
-	)
-	
-	if existing_booking:
-		return {"status": "error", "message": "Already booked this class"}
-	
-	# Create booking
-	booking = frappe.get_doc({
-		"doctype": "Gym Class Booking",
-		"member": member_id,
-		"gym_class": class_name,
-		"class_date": class_date,
-		"class_time": class_time,
-		"status": "Confirmed",
-		"amount_paid": class_doc.price,
-		"currency": class_doc.currency
-	})
-	booking.insert()
+def book_class(member_id, class_name, class_date, class_time, join_waitlist=0):
+	"""Book a class for a member, optionally joining the waitlist when it is full"""
+	return book_gym_class(member_id, class_name, class_date, class_time, join_waitlist)
+
+
+@frappe.whitelist()
+def get_booking_request_status(request_id):
+	"""Get the status of a queued class booking"""
+	return get_request_status(request_id)
+
+
+@frappe.whitelist()
+def book_class_series(member_id, class_name, day_of_week, class_time, occurrences, start_date=None):
+	"""Book the same weekly class session for a number of weeks"""
+	result = book_series(member_id, class_name, day_of_week, class_time, occurrences, start_date)
 	
 	return {
-		"status": "success",
-		"message": "Class booked successfully",
-		"booking_id": booking.name
+		"status": "success" if result["booked"] else "error",
+		"message": f"Booked {len(result['booked'])} of {cint(occurrences)} classes",
+		**result
 	}
 
 
@@ -271,51 +220,23 @@ def get_available_classes(date=None):
 	if not date:
 		date = today()
 	
-	# Get all active classes
-	classes = frappe.get_all(
-		"Gym Class",
-		filters={"is_active": 1},
-		fields=["*"]
-	)
-	
-	available_classes = []
-	
-	for class_doc in classes:
-		class_info = frappe.get_doc("Gym Class", class_doc.name)
-		
-		# Get class schedule for the date
-		day_of_week = frappe.utils.get_datetime(date).strftime("%A")
-		
-		for schedule in class_info.schedule:
-			if schedule.day_of_week == day_of_week and schedule.is_active:
-				# Check capacity
-				bookings = frappe.get_all(
-					"Gym Class Booking",
-					filters={
-						"gym_class": class_doc.name,
-						"class_date": date,
-						"class_time": schedule.start_time,
-						"status": "Confirmed"
-					}
-				)
-				
-				available_spots = class_doc.max_capacity - len(bookings)
-				
-				available_classes.append({
-					"class_name": class_doc.class_name,
-					"class_type": class_doc.class_type,
-					"trainer": class_doc.trainer,
-					"start_time": schedule.start_time,
-					"end_time": schedule.end_time,
-					"duration": class_doc.duration_minutes,
-					"price": class_doc.price,
-					"currency": class_doc.currency,
-					"available_spots": available_spots,
-					"max_capacity": class_doc.max_capacity,
-					"class_level": class_doc.class_level
-				})
-	
-	return available_classes
+	return get_cached_class_availability(date)[str(getdate(date))]
+
+
+@frappe.whitelist()
+def get_available_classes_for_range(start_date=None, end_date=None):
+	"""Get available classes for every date in a range, a week by default"""
+	if not start_date:
+		start_date = today()
+	if not end_date:
+		end_date = add_days(start_date, 6)
+	
+	if date_diff(end_date, start_date) < 0:
+		frappe.throw(_("End date must be on or after start date"))
+	if date_diff(end_date, start_date) > 30:
+		frappe.throw(_("Date range cannot be longer than 31 days"))
+	
+	return get_cached_class_availability(start_date, end_date)
 
 
 @frappe.whitelist()
@@ -0,0 +1,212 @@
+import calendar
+
+import frappe
+from frappe import _
+from frappe.query_builder.functions import Count, Extract, Floor
+from frappe.utils import add_days, cint, date_diff, get_time, getdate, today
+from pypika.enums import DatePart
+
+# Redis hash of member -> open visit, maintained from Gym Visit check-in/check-out
+OPEN_VISITS_KEY = "gms:open_visits"
+OPEN_VISITS_BUILT_KEY = "gms:open_visits_built"
+HISTOGRAM_CACHE_KEY = "gms:occupancy_histogram"
+
+
+def rebuild_open_visit_index():
+	"""Rebuild the open visit index from the Gym Visit table"""
+	visits = frappe.get_all(
+		"Gym Visit",
+		filters={"check_out_time": ["is", "not set"]},
+		fields=["name", "member", "visit_date", "check_in_time"],
+		order_by="visit_date asc, check_in_time asc"
+	)
+	
+	cache = frappe.cache()
+	cache.delete_value(OPEN_VISITS_KEY)
+	for visit in visits:
+		cache.hset(OPEN_VISITS_KEY, visit.member, _index_entry(visit))
+	cache.set_value(OPEN_VISITS_BUILT_KEY, 1)
+	
+	return len(visits)
+
+
+def ensure_open_visit_index():
+	"""Build the index if it has never been built or the cache was flushed"""
+	if not frappe.cache().get_value(OPEN_VISITS_BUILT_KEY):
+		rebuild_open_visit_index()
+
+
+def add_open_visits(visits):
+	"""Add open visits to the index once the current transaction commits"""
+	entries = {v.member: _index_entry(v) for v in visits if not v.check_out_time}
+	if not entries:
+		return
+	
+	def update_index():
+		cache = frappe.cache()
+		for member, entry in entries.items():
+			cache.hset(OPEN_VISITS_KEY, member, entry)
+	
+	frappe.db.after_commit.add(update_index)
+
+
+def remove_open_visits(visits):
+	"""Remove visits from the index once the current transaction commits"""
+	names = {v.member: v.name for v in visits}
+	if not names:
+		return
+	
+	def update_index():
+		cache = frappe.cache()
+		for member, visit in names.items():
+			entry = cache.hget(OPEN_VISITS_KEY, member)
+			# A newer visit for the member may already have replaced this one
+			if entry and entry.get("visit") == visit:
+				cache.hdel(OPEN_VISITS_KEY, member)
+	
+	frappe.db.after_commit.add(update_index)
+
+
+def get_open_visit_entry(member_id, visit_date=None):
+	"""Get the indexed open visit of a member, optionally only for a given date"""
+	ensure_open_visit_index()
+	entry = frappe.cache().hget(OPEN_VISITS_KEY, member_id)
+	if entry and visit_date and entry.get("visit_date") != str(visit_date):
+		return None
+	
+	return entry
+
+
+def get_open_visit_entries(visit_date=None):
+	"""Get all indexed open visits keyed by member"""
+	ensure_open_visit_index()
+	entries = frappe.cache().hgetall(OPEN_VISITS_KEY) or {}
+	if visit_date:
+		entries = {m: e for m, e in entries.items() if e.get("visit_date") == str(visit_date)}
+	
+	return entries
+
+
+def _index_entry(visit):
+	return {
+		"visit": visit.name,
+		"visit_date": str(visit.visit_date),
+		"check_in_time": str(get_time(visit.check_in_time))
+	}
+
+
+@frappe.whitelist()
+def is_member_inside(member_id):
+	"""Check whether a member is currently checked in"""
+	entry = get_open_visit_entry(member_id, today())
+	return {
+		"member_id": member_id,
+		"is_inside": bool(entry),
+		"visit_id": entry.get("visit") if entry else None,
+		"check_in_time": entry.get("check_in_time") if entry else None
+	}
+
+
+@frappe.whitelist()
+def get_live_occupancy(include_members=False):
+	"""Get the live headcount of members currently in the gym"""
+	entries = get_open_visit_entries(today())
+	
+	occupancy = {"headcount": len(entries)}
+	if frappe.utils.cint(include_members):
+		occupancy["members"] = sorted(
+			(
+				{"member_id": member, "visit_id": e["visit"], "check_in_time": e["check_in_time"]}
+				for member, e in entries.items()
+			),
+			key=lambda m: m["check_in_time"]
+		)
+	
+	return occupancy
+
+
+@frappe.whitelist()
+def rebuild_occupancy_index():
+	"""Rebuild the live occupancy index from Gym Visit"""
+	frappe.only_for(("System Manager", "Gym Manager"))
+	return {"open_visits": rebuild_open_visit_index()}
+
+
+@frappe.whitelist()
+def get_occupancy_histogram(start_date=None, end_date=None, bucket_minutes=15):
+	"""Get average occupancy per time bucket for each day of the week
+	
+	Visits are binned in SQL into start and end buckets per date, so the data
+	pulled back is bounded by days x buckets instead of the number of visits. A
+	sweep over those counts (+1 at check-in, -1 after check-out, running sum)
+	then gives the number of members present in every bucket.
+	"""
+	if not end_date:
+		end_date = today()
+	if not start_date:
+		start_date = add_days(end_date, -27)
+	
+	start_date, end_date = getdate(start_date), getdate(end_date)
+	bucket_minutes = cint(bucket_minutes) or 15
+	if bucket_minutes <= 0 or 1440 % bucket_minutes:
+		frappe.throw(_("Bucket size must evenly divide a day"))
+	
+	cache_key = f"{HISTOGRAM_CACHE_KEY}:{start_date}:{end_date}:{bucket_minutes}"
+	histogram = frappe.cache().get_value(cache_key)
+	if histogram is None:
+		histogram = _build_occupancy_histogram(start_date, end_date, bucket_minutes)
+		# Closed ranges no longer change, ranges including today keep filling in
+		expires_in = 86400 if end_date < getdate(today()) else 300
+		frappe.cache().set_value(cache_key, histogram, expires_in_sec=expires_in)
+	
+	return histogram
+
+
+def _build_occupancy_histogram(start_date, end_date, bucket_minutes):
+	buckets = 1440 // bucket_minutes
+	Visit = frappe.qb.DocType("Gym Visit")
+	
+	def minutes(column):
+		return Extract(DatePart.hour, column) * 60 + Extract(DatePart.minute, column)
+	
+	def bucket_counts(bucket):
+		return (
+			frappe.qb.from_(Visit)
+			.select(Visit.visit_date, bucket.as_("bucket"), Count("*").as_("visits"))
+			.where(Visit.visit_date.between(start_date, end_date))
+			.where(Visit.check_out_time.isnotnull())
+			.groupby(Visit.visit_date, bucket)
+		).run(as_dict=True)
+	
+	# A visit occupies every bucket it overlaps: [floor(in), ceil(out))
+	starts = bucket_counts(Floor(minutes(Visit.check_in_time) / bucket_minutes))
+	ends = bucket_counts(Floor((minutes(Visit.check_out_time) + bucket_minutes - 1) / bucket_minutes))
+	
+	deltas = [[0] * (buckets + 1) for _ in range(7)]
+	for rows, sign in ((starts, 1), (ends, -1)):
+		for row in rows:
+			deltas[getdate(row.visit_date).weekday()][min(int(row.bucket), buckets)] += sign * row.visits
+	
+	day_counts = [0] * 7
+	for offset in range(date_diff(end_date, start_date) + 1):
+		day_counts[getdate(add_days(start_date, offset)).weekday()] += 1
+	
+	days = {}
+	for weekday in range(7):
+		present = 0
+		curve = []
+		for bucket in range(buckets):
+			present += deltas[weekday][bucket]
+			minute = bucket * bucket_minutes
+			curve.append({
+				"time": f"{minute // 60:02d}:{minute % 60:02d}",
+				"average_occupancy": round(present / day_counts[weekday], 2) if day_counts[weekday] else 0
+			})
+		days[calendar.day_name[weekday]] = curve
+	
+	return {
+		"start_date": str(start_date),
+		"end_date": str(end_date),
+		"bucket_minutes": bucket_minutes,
+		"days": days
+	}
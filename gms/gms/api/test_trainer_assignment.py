@@ -0,0 +1,67 @@
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from gms.gms.api.trainer_assignment import _overlaps, solve_assignment
+
+
+def make_trainer(first_name):
+	return frappe.get_doc({
+		"doctype": "Gym Trainer",
+		"naming_series": "TR-.YYYY.-",
+		"first_name": first_name,
+		"last_name": "Assignment",
+		"email": f"{first_name.lower()}.{frappe.generate_hash(length=8)}@example.com",
+		"mobile_no": "9876543210",
+		"working_hours": [{"day_of_week": "Monday", "start_time": "09:00:00", "end_time": "17:00:00"}]
+	}).insert(ignore_permissions=True)
+
+
+def make_class(name, trainer, sessions):
+	return frappe._dict(name=name, class_name=name, class_type="Yoga", trainer=trainer, sessions=sessions)
+
+
+class TestTrainerAssignment(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.x = make_trainer("Xavier")
+		cls.y = make_trainer("Yvonne")
+
+	def assert_no_new_overlaps(self, classes, assignment):
+		"""Every class ends up with its assigned or kept trainer, and no changed class overlaps another of theirs"""
+		final = {c.name: assignment.get(c.name, c.trainer) for c in classes}
+		for i, a in enumerate(classes):
+			for b in classes[i + 1:]:
+				if final[a.name] == final[b.name] and _overlaps(a, b):
+					self.assertEqual(final[a.name], a.trainer)
+					self.assertEqual(final[b.name], b.trainer)
+
+	def test_unplaceable_class_keeps_its_trainer(self):
+		# Nobody works Sundays, so A cannot be placed and stays with X on Monday 10:00-11:00
+		a = make_class("A", self.x.name, [("Monday", 600, 660), ("Sunday", 600, 660)])
+		b = make_class("B", None, [("Monday", 630, 690)])
+		assignment, unassigned = solve_assignment([a, b], [self.x])
+
+		self.assertNotIn("B", assignment)
+		self.assertIn("A", unassigned)
+		self.assertIn("B", unassigned)
+		self.assert_no_new_overlaps([a, b], assignment)
+
+	def test_unplaceable_class_leaves_other_trainers_free(self):
+		a = make_class("A", self.x.name, [("Monday", 600, 660), ("Sunday", 600, 660)])
+		b = make_class("B", self.x.name, [("Monday", 630, 690)])
+		assignment, unassigned = solve_assignment([a, b], [self.x, self.y])
+
+		self.assertEqual(assignment, {"B": self.y.name})
+		self.assertIn("A", unassigned)
+
+	def test_class_left_out_by_search_keeps_its_trainer(self):
+		classes = [
+			make_class("A", self.x.name, [("Monday", 600, 660)]),
+			make_class("B", self.y.name, [("Monday", 600, 660)]),
+			make_class("C", self.x.name, [("Monday", 630, 690)])
+		]
+		assignment, unassigned = solve_assignment(classes, [self.x, self.y])
+
+		self.assertEqual(len(assignment) + len(unassigned), 3)
+		self.assert_no_new_overlaps(classes, assignment)
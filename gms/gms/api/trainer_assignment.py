@@ -0,0 +1,246 @@
+import json
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from gms.gms.api.trainer_availability import (
+	WEEKDAYS,
+	build_trainer_intervals,
+	get_conflicts,
+	invalidate_trainer_intervals,
+	to_minutes,
+	within_working_hours,
+)
+from gms.gms.api.trainer_calendar import invalidate_trainer_calendar
+from gms.gms.doctype.gym_class.gym_class import invalidate_class_availability
+from gms.gms.doctype.gym_class_slot.gym_class_slot import sync_class_slots
+
+# Search steps after which the solver settles for the best assignment found so far
+MAX_SEARCH_STEPS = 50000
+
+
+def get_class_sessions(classes=None):
+	"""Get the active weekly sessions of active classes as (day, start, end) minutes"""
+	GymClass = frappe.qb.DocType("Gym Class")
+	Schedule = frappe.qb.DocType("Gym Class Schedule")
+	query = (
+		frappe.qb.from_(GymClass)
+		.join(Schedule)
+		.on((Schedule.parent == GymClass.name) & (Schedule.parenttype == "Gym Class"))
+		.select(
+			GymClass.name,
+			GymClass.class_name,
+			GymClass.class_type,
+			GymClass.trainer,
+			Schedule.day_of_week,
+			Schedule.start_time,
+			Schedule.end_time
+		)
+		.where(GymClass.is_active == 1)
+		.where(Schedule.is_active == 1)
+	)
+	if classes:
+		query = query.where(GymClass.name.isin(classes))
+	
+	sessions = {}
+	for row in query.run(as_dict=True):
+		if row.day_of_week not in WEEKDAYS or not row.start_time or not row.end_time:
+			continue
+		entry = sessions.setdefault(row.name, frappe._dict(
+			name=row.name, class_name=row.class_name, class_type=row.class_type, trainer=row.trainer, sessions=[]
+		))
+		entry.sessions.append((row.day_of_week, to_minutes(row.start_time), to_minutes(row.end_time)))
+	
+	return sessions
+
+
+def _overlaps(a, b):
+	return any(
+		day_a == day_b and start_a < end_b and start_b < end_a
+		for day_a, start_a, end_a in a.sessions
+		for day_b, start_b, end_b in b.sessions
+	)
+
+
+def _can_teach(day, start, end, classes):
+	"""Check working hours and sessions of the trainer's classes outside this run"""
+	return within_working_hours(day, start, end) and not any(
+		conflict[2] not in classes for conflict in get_conflicts(day, start, end)
+	)
+
+
+def _matches_specialization(trainer, class_type):
+	return bool(class_type and class_type.lower() in (trainer.specialization or "").lower())
+
+
+def solve_assignment(classes, trainers, require_specialization=False):
+	"""Assign one trainer to each class so no trainer has overlapping sessions
+	
+	A trainer can take a class when their working hours cover every session of
+	it and none of their classes outside this run overlaps it. A class left
+	unassigned keeps its current trainer, so its sessions stay on that trainer's
+	week and no overlapping class is given to them.
+	
+	The search is a depth-first branch and bound over classes, taking the class
+	with the fewest remaining trainers first and leaving a class out only when
+	that can still beat the best assignment found. Trainers whose specialization
+	mentions the class type are tried first, then the least loaded, so stopping
+	at MAX_SEARCH_STEPS still returns the best assignment found so far.
+	
+	Returns (assignment of class -> trainer, dict of unassigned class -> reason).
+	"""
+	intervals = build_trainer_intervals([t.name for t in trainers])
+	classes = {c.name: c for c in classes}
+	
+	candidates = {}
+	unassignable = {}
+	for c in classes.values():
+		options = [
+			t for t in trainers
+			if all(_can_teach(intervals[t.name][day], start, end, classes) for day, start, end in c.sessions)
+			and (not require_specialization or _matches_specialization(t, c.class_type))
+		]
+		if options:
+			candidates[c.name] = options
+		elif require_specialization:
+			unassignable[c.name] = _("No trainer with a matching specialization works all of its sessions")
+		else:
+			unassignable[c.name] = _("No trainer works all of its sessions")
+	
+	# Classes that cannot be placed keep their trainer, which can leave further classes without one
+	kept = list(unassignable)
+	while kept:
+		c = classes[kept.pop()]
+		for name in [name for name in candidates if _overlaps(c, classes[name])]:
+			candidates[name] = [t for t in candidates[name] if t.name != c.trainer]
+			if not candidates[name]:
+				del candidates[name]
+				unassignable[name] = _("Sessions overlap with unassigned classes kept by every available trainer")
+				kept.append(name)
+	
+	conflicts = {name: set() for name in candidates}
+	names = list(candidates)
+	for i, a in enumerate(names):
+		for b in names[i + 1:]:
+			if _overlaps(classes[a], classes[b]):
+				conflicts[a].add(b)
+				conflicts[b].add(a)
+	
+	assignment, skipped = {}, set()
+	load = {t.name: 0 for t in trainers}
+	# Forward checking: how many assigned neighbours block each trainer for a class
+	blocked = {name: {t.name: 0 for t in options} for name, options in candidates.items()}
+	domain_size = {name: len(options) for name, options in candidates.items()}
+	best = {}
+	steps = 0
+	
+	def assign(name, trainer, step):
+		for other in conflicts[name]:
+			if trainer in blocked[other]:
+				blocked[other][trainer] += step
+				if blocked[other][trainer] == (1 if step > 0 else 0):
+					domain_size[other] -= step
+	
+	def search():
+		"""Depth-first branch and bound, returns True once the search should stop"""
+		nonlocal best, steps
+		steps += 1
+		open_classes = [name for name in candidates if name not in assignment and name not in skipped]
+		if len(assignment) + len(open_classes) <= len(best):
+			return False
+		if not open_classes:
+			best = dict(assignment)
+			return len(best) == len(candidates)
+		if steps > MAX_SEARCH_STEPS:
+			return True
+		
+		name = min(open_classes, key=lambda n: (domain_size[n], n))
+		# A trainer stays reserved for their overlapping classes until those are decided,
+		# so leaving one of those out with its current trainer is always possible
+		reserved = {classes[other].trainer for other in conflicts[name] if other in open_classes}
+		reserved.discard(classes[name].trainer)
+		ranked = sorted(
+			(t for t in candidates[name] if not blocked[name][t.name] and t.name not in reserved),
+			key=lambda t: (not _matches_specialization(t, classes[name].class_type), load[t.name], t.name)
+		)
+		for trainer in ranked:
+			assignment[name] = trainer.name
+			load[trainer.name] += 1
+			assign(name, trainer.name, 1)
+			if search():
+				return True
+			assign(name, trainer.name, -1)
+			load[trainer.name] -= 1
+			del assignment[name]
+		
+		# Leave the class out with its current trainer, who then cannot take its overlapping classes
+		kept_trainer = classes[name].trainer
+		if kept_trainer and any(
+			assignment.get(other) == kept_trainer and classes[other].trainer != kept_trainer for other in conflicts[name]
+		):
+			return False
+		skipped.add(name)
+		assign(name, kept_trainer, 1)
+		stop = search()
+		assign(name, kept_trainer, -1)
+		skipped.discard(name)
+		return stop
+	
+	search()
+	
+	for name in candidates:
+		if name not in best:
+			unassignable[name] = _("Sessions overlap with classes given to every available trainer")
+	
+	return best, unassignable
+
+
+@frappe.whitelist()
+def assign_trainers(classes=None, dry_run=1, require_specialization=0):
+	"""Assign trainers to classes in one batch, or report the assignment without saving"""
+	frappe.only_for(("System Manager", "Gym Manager"))
+	
+	if isinstance(classes, str):
+		classes = json.loads(classes) if classes.startswith("[") else [c.strip() for c in classes.split(",") if c.strip()]
+	
+	class_sessions = get_class_sessions(classes)
+	trainers = frappe.get_all("Gym Trainer", filters={"is_active": 1}, fields=["name", "specialization"])
+	assignment, unassigned = solve_assignment(list(class_sessions.values()), trainers, cint(require_specialization))
+	
+	report = {
+		"dry_run": bool(cint(dry_run)),
+		"assigned": [
+			{
+				"class_id": name,
+				"class_name": class_sessions[name].class_name,
+				"current_trainer": class_sessions[name].trainer,
+				"trainer": trainer,
+				"changed": class_sessions[name].trainer != trainer
+			}
+			for name, trainer in sorted(assignment.items())
+		],
+		"unassigned": [
+			{
+				"class_id": name,
+				"class_name": class_sessions[name].class_name,
+				"current_trainer": class_sessions[name].trainer,
+				"reason": reason
+			}
+			for name, reason in sorted(unassigned.items())
+		]
+	}
+	if report["dry_run"]:
+		return report
+	
+	# The batch is consistent as a whole, so it is written without re-validating one class at a time
+	changed = [row for row in report["assigned"] if row["changed"]]
+	for row in changed:
+		frappe.db.set_value("Gym Class", row["class_id"], "trainer", row["trainer"])
+		sync_class_slots(row["class_id"])
+	
+	trainers = [row["trainer"] for row in changed] + [row["current_trainer"] for row in changed]
+	invalidate_trainer_intervals(trainers)
+	invalidate_trainer_calendar(trainers)
+	invalidate_class_availability()
+	return report
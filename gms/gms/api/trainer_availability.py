@@ -0,0 +1,212 @@
+from bisect import bisect_left, bisect_right
+
+import frappe
+from frappe.utils import get_time
+
+# Redis hash of trainer -> weekly interval index, see build_trainer_intervals
+TRAINER_INTERVALS_KEY = "gms:trainer_intervals"
+
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def to_minutes(value):
+	"""Minutes since midnight of a time, time string or timedelta"""
+	time = get_time(value)
+	return time.hour * 60 + time.minute
+
+
+def format_minutes(minutes):
+	return f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+
+
+def build_trainer_intervals(trainers):
+	"""Build the weekly interval index of several trainers with two queries
+	
+	For every weekday a trainer's index holds the merged working hours, the
+	class sessions sorted by start with a running maximum of their ends, and the
+	free intervals left once the classes are taken out of the working hours.
+	"""
+	index = {
+		trainer: {day: {"working": [], "classes": [], "free": []} for day in WEEKDAYS}
+		for trainer in trainers
+	}
+	if not index:
+		return index
+	
+	for row in frappe.get_all(
+		"Gym Trainer Working Hours",
+		filters={"parenttype": "Gym Trainer", "parent": ["in", list(index)], "is_active": 1},
+		fields=["parent", "day_of_week", "start_time", "end_time"]
+	):
+		if row.day_of_week in WEEKDAYS and row.start_time and row.end_time:
+			index[row.parent][row.day_of_week]["working"].append(
+				(to_minutes(row.start_time), to_minutes(row.end_time))
+			)
+	
+	GymClass = frappe.qb.DocType("Gym Class")
+	Schedule = frappe.qb.DocType("Gym Class Schedule")
+	sessions = (
+		frappe.qb.from_(GymClass)
+		.join(Schedule)
+		.on((Schedule.parent == GymClass.name) & (Schedule.parenttype == "Gym Class"))
+		.select(
+			GymClass.trainer,
+			GymClass.name,
+			GymClass.class_name,
+			GymClass.class_type,
+			Schedule.day_of_week,
+			Schedule.start_time,
+			Schedule.end_time
+		)
+		.where(GymClass.trainer.isin(list(index)))
+		.where(GymClass.is_active == 1)
+		.where(Schedule.is_active == 1)
+	).run(as_dict=True)
+	for row in sessions:
+		if row.day_of_week in WEEKDAYS and row.start_time and row.end_time:
+			index[row.trainer][row.day_of_week]["classes"].append(
+				(to_minutes(row.start_time), to_minutes(row.end_time), row.name, row.class_name, row.class_type)
+			)
+	
+	for days in index.values():
+		for day in days.values():
+			day["working"] = _merge(day["working"])
+			day["working_starts"] = [w[0] for w in day["working"]]
+			day["classes"].sort()
+			day["class_starts"] = [c[0] for c in day["classes"]]
+			day["class_max_ends"] = _running_max(c[1] for c in day["classes"])
+			day["free"] = _subtract(day["working"], _merge((c[0], c[1]) for c in day["classes"]))
+			day["free_starts"] = [f[0] for f in day["free"]]
+	
+	return index
+
+
+def _merge(intervals):
+	merged = []
+	for start, end in sorted(intervals):
+		if merged and start <= merged[-1][1]:
+			merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+		else:
+			merged.append((start, end))
+	return merged
+
+
+def _running_max(values):
+	running, current = [], None
+	for value in values:
+		current = value if current is None else max(current, value)
+		running.append(current)
+	return running
+
+
+def _subtract(intervals, busy):
+	"""Take sorted, merged busy intervals out of sorted, merged intervals"""
+	free = []
+	for start, end in intervals:
+		for busy_start, busy_end in busy:
+			if busy_end <= start or busy_start >= end:
+				continue
+			if busy_start > start:
+				free.append((start, busy_start))
+			start = max(start, busy_end)
+		if start < end:
+			free.append((start, end))
+	return free
+
+
+def get_trainer_intervals(trainers):
+	"""Get the interval index of trainers from the cache, building the missing ones together"""
+	cache = frappe.cache()
+	index = {trainer: cache.hget(TRAINER_INTERVALS_KEY, trainer) for trainer in trainers}
+	missing = [trainer for trainer, intervals in index.items() if intervals is None]
+	if missing:
+		for trainer, intervals in build_trainer_intervals(missing).items():
+			index[trainer] = intervals
+			cache.hset(TRAINER_INTERVALS_KEY, trainer, intervals)
+	
+	return index
+
+
+def invalidate_trainer_intervals(trainers):
+	"""Drop trainers from the index once the current transaction commits"""
+	trainers = {trainer for trainer in trainers if trainer}
+	if not trainers:
+		return
+	
+	def clear_cache():
+		cache = frappe.cache()
+		for trainer in trainers:
+			cache.hdel(TRAINER_INTERVALS_KEY, trainer)
+	
+	frappe.db.after_commit.add(clear_cache)
+
+
+def is_free(day, start, end):
+	"""Check a day's index for a free interval covering [start, end) in O(log n)"""
+	i = bisect_right(day["free_starts"], start) - 1
+	return i >= 0 and day["free"][i][1] >= end
+
+
+def within_working_hours(day, start, end):
+	i = bisect_right(day["working_starts"], start) - 1
+	return i >= 0 and day["working"][i][1] >= end
+
+
+def get_conflicts(day, start, end, exclude_class=None):
+	"""Get class sessions of a day overlapping [start, end)
+	
+	Only sessions starting before ``end`` can overlap, and the running maximum of
+	their ends rules out a conflict in O(log n) before any session is looked at.
+	"""
+	i = bisect_left(day["class_starts"], end)
+	if not i or day["class_max_ends"][i - 1] <= start:
+		return []
+	
+	return [c for c in day["classes"][:i] if c[1] > start and c[2] != exclude_class]
+
+
+def is_trainer_available(trainer, day_of_week, start_time, end_time, exclude_class=None):
+	"""Check whether a trainer works and has no class at a weekly time
+	
+	``exclude_class`` ignores that class's own sessions, for re-validating a
+	class that is already on the trainer's schedule.
+	"""
+	day = get_trainer_intervals([trainer])[trainer][day_of_week]
+	start, end = to_minutes(start_time), to_minutes(end_time)
+	if not exclude_class:
+		return is_free(day, start, end)
+	
+	return within_working_hours(day, start, end) and not get_conflicts(day, start, end, exclude_class)
+
+
+def get_available_trainer_names(trainers, day_of_week, start_time, end_time):
+	"""Filter trainers free for a whole weekly time window in one pass over the index"""
+	start, end = to_minutes(start_time), to_minutes(end_time)
+	index = get_trainer_intervals(trainers)
+	return [trainer for trainer in trainers if is_free(index[trainer][day_of_week], start, end)]
+
+
+@frappe.whitelist()
+def get_trainer_free_windows(date=None, trainer=None, min_minutes=0):
+	"""Get each active trainer's free windows for a day, optionally of a minimum length"""
+	day_of_week = frappe.utils.get_datetime(date or frappe.utils.today()).strftime("%A")
+	min_minutes = frappe.utils.cint(min_minutes)
+	
+	filters = {"is_active": 1}
+	if trainer:
+		filters["name"] = trainer
+	trainers = frappe.get_all("Gym Trainer", filters=filters, fields=["name", "first_name", "last_name"])
+	index = get_trainer_intervals([t.name for t in trainers])
+	
+	return [
+		{
+			"trainer": t.name,
+			"trainer_name": " ".join(filter(None, [t.first_name, t.last_name])),
+			"free_windows": [
+				{"start_time": format_minutes(start), "end_time": format_minutes(end), "minutes": end - start}
+				for start, end in index[t.name][day_of_week]["free"]
+				if end - start >= min_minutes
+			]
+		}
+		for t in trainers
+	]
@@ -0,0 +1,173 @@
+import hashlib
+import json
+
+import frappe
+from frappe.utils import add_days, get_time, getdate, now_datetime, today
+from frappe.utils.response import json_handler
+from werkzeug.wrappers import Response
+
+from gms.gms.api.trainer_availability import format_minutes, get_trainer_intervals
+
+# Redis hash per trainer of week start -> calendar, see get_trainer_calendar
+TRAINER_CALENDAR_KEY = "gms:trainer_calendar"
+
+
+def get_week_start(date=None):
+	date = getdate(date or today())
+	return getdate(add_days(date, -date.weekday()))
+
+
+def build_trainer_calendar(trainer, week_start):
+	"""Build a trainer's calendar for a week from working hours and the generated class slots"""
+	working = get_trainer_intervals([trainer])[trainer]
+	days = []
+	for offset in range(7):
+		date = getdate(add_days(week_start, offset))
+		day_of_week = date.strftime("%A")
+		days.append({
+			"date": str(date),
+			"day_of_week": day_of_week,
+			"working_hours": [
+				{"start_time": format_minutes(start), "end_time": format_minutes(end)}
+				for start, end in working[day_of_week]["working"]
+			],
+			"sessions": []
+		})
+	
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	GymClass = frappe.qb.DocType("Gym Class")
+	slots = (
+		frappe.qb.from_(Slot)
+		.join(GymClass)
+		.on(GymClass.name == Slot.gym_class)
+		.select(
+			Slot.name,
+			Slot.gym_class,
+			GymClass.class_name,
+			GymClass.class_type,
+			Slot.class_date,
+			Slot.class_time,
+			Slot.end_time,
+			Slot.capacity,
+			Slot.booked_count
+		)
+		.where(Slot.trainer == trainer)
+		.where(Slot.class_date.between(week_start, getdate(add_days(week_start, 6))))
+		.where(Slot.is_active == 1)
+		.orderby(Slot.class_date)
+		.orderby(Slot.class_time)
+	).run(as_dict=True)
+	for slot in slots:
+		days[(getdate(slot.class_date) - week_start).days]["sessions"].append({
+			"slot": slot.name,
+			"class_id": slot.gym_class,
+			"class_name": slot.class_name,
+			"class_type": slot.class_type,
+			"start_time": str(get_time(slot.class_time)),
+			"end_time": str(get_time(slot.end_time)) if slot.end_time else None,
+			"booked": slot.booked_count,
+			"capacity": slot.capacity
+		})
+	
+	calendar = {"trainer": trainer, "week_start": str(week_start), "days": days}
+	return {
+		"calendar": calendar,
+		"etag": hashlib.sha1(json.dumps(calendar, sort_keys=True).encode()).hexdigest(),
+		"generated_at": str(now_datetime())
+	}
+
+
+def get_trainer_calendar(trainer, date=None):
+	"""Get a trainer's cached weekly calendar entry, building it on a miss"""
+	week_start = get_week_start(date)
+	key = f"{TRAINER_CALENDAR_KEY}:{trainer}"
+	entry = frappe.cache().hget(key, str(week_start))
+	if entry is None:
+		entry = build_trainer_calendar(trainer, week_start)
+		frappe.cache().hset(key, str(week_start), entry)
+	
+	return entry
+
+
+def invalidate_trainer_calendar(trainers):
+	"""Drop every cached week of trainers once the current transaction commits"""
+	trainers = {trainer for trainer in trainers if trainer}
+	if not trainers:
+		return
+	
+	def clear_cache():
+		cache = frappe.cache()
+		for trainer in trainers:
+			cache.delete_value(f"{TRAINER_CALENDAR_KEY}:{trainer}")
+	
+	frappe.db.after_commit.add(clear_cache)
+
+
+def _conditional_response(entry, body, mimetype, filename=None):
+	"""Answer 304 when the client already has this version of the calendar"""
+	etag = f'"{entry["etag"]}"'
+	headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+	if filename:
+		headers["Content-Disposition"] = f'inline; filename="{filename}"'
+	
+	if frappe.request and etag in (frappe.request.headers.get("If-None-Match") or ""):
+		return Response(status=304, headers=headers)
+	
+	return Response(body(), mimetype=mimetype, headers=headers)
+
+
+@frappe.whitelist()
+def get_trainer_week(trainer, date=None):
+	"""Get a trainer's weekly calendar as JSON with ETag support"""
+	entry = get_trainer_calendar(trainer, date)
+	return _conditional_response(
+		entry,
+		lambda: json.dumps({"message": entry["calendar"]}, default=json_handler),
+		"application/json"
+	)
+
+
+@frappe.whitelist()
+def get_trainer_ical(trainer, date=None):
+	"""Get a trainer's weekly calendar as an iCal feed with ETag support"""
+	entry = get_trainer_calendar(trainer, date)
+	return _conditional_response(
+		entry,
+		lambda: _to_ical(entry),
+		"text/calendar",
+		f"{trainer}-{entry['calendar']['week_start']}.ics"
+	)
+
+
+def _to_ical(entry):
+	stamp = _ical_datetime(entry["generated_at"][:10], entry["generated_at"][11:19])
+	lines = [
+		"BEGIN:VCALENDAR",
+		"VERSION:2.0",
+		"PRODID:-//GMS//Trainer Calendar//EN",
+		"CALSCALE:GREGORIAN",
+		f"X-WR-CALNAME:{_ical_text(entry['calendar']['trainer'])}"
+	]
+	for day in entry["calendar"]["days"]:
+		for session in day["sessions"]:
+			description = "{} - {}/{} booked".format(session["class_type"] or "", session["booked"], session["capacity"])
+			lines += [
+				"BEGIN:VEVENT",
+				f"UID:{session['slot']}@gms",
+				f"DTSTAMP:{stamp}",
+				f"DTSTART:{_ical_datetime(day['date'], session['start_time'])}",
+				*([f"DTEND:{_ical_datetime(day['date'], session['end_time'])}"] if session["end_time"] else []),
+				f"SUMMARY:{_ical_text(session['class_name'] or session['class_id'])}",
+				f"DESCRIPTION:{_ical_text(description)}",
+				"END:VEVENT"
+			]
+	lines.append("END:VCALENDAR")
+	return "\r\n".join(lines) + "\r\n"
+
+
+def _ical_datetime(date, time):
+	return f"{date.replace('-', '')}T{str(get_time(time)).replace(':', '')[:6]}"
+
+
+def _ical_text(value):
+	return str(value).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
@@ -0,0 +1,179 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import add_to_date, now_datetime
+from frappe.utils.background_jobs import get_job_status
+
+from gms.gms.doctype.gym_class_slot.gym_class_slot import get_slot_key, get_waitlist_rank
+
+
+class GymBookingRequest(Document):
+	pass
+
+
+def is_queued_booking_enabled():
+	return bool(frappe.db.get_single_value("Gym Settings", "enable_queued_booking"))
+
+
+def queue_booking(member_id, class_id, class_date, class_time, join_waitlist=0):
+	"""Accept a booking into its slot's queue and make sure a worker drains it"""
+	request = frappe.get_doc({
+		"doctype": "Gym Booking Request",
+		"member": member_id,
+		"gym_class": class_id,
+		"class_date": class_date,
+		"class_time": class_time,
+		"slot_key": get_slot_key(class_id, class_date, class_time),
+		"join_waitlist": frappe.utils.cint(join_waitlist),
+		"status": "Queued"
+	}).insert(ignore_permissions=True)
+	
+	enqueue_slot_queue(request.slot_key)
+	return request
+
+
+def enqueue_slot_queue(slot_key):
+	"""Start a worker for a slot's queue once the current transaction commits
+	
+	A worker that is already running may be past its last look at the queue, so
+	a follow-up worker is queued behind it instead of relying on that one.
+	"""
+	def enqueue():
+		job_id = f"gms-booking-queue-{slot_key}"
+		if get_job_status(job_id) == "started":
+			job_id = f"{job_id}-next"
+		
+		frappe.enqueue(
+			"gms.gms.doctype.gym_booking_request.gym_booking_request.process_booking_queue",
+			queue="short",
+			job_id=job_id,
+			deduplicate=True,
+			slot_key=slot_key
+		)
+	
+	frappe.db.after_commit.add(enqueue)
+
+
+def process_booking_queue(slot_key):
+	"""Book a slot's queued requests one at a time in arrival order
+	
+	One worker per slot means bookings of the same slot no longer wait on each
+	other's row locks in web workers. Each request is committed on its own, so a
+	failed request does not hold back the rest of the queue. A lock timeout or
+	deadlock leaves the request queued and stops the worker, and
+	process_pending_booking_requests restarts it. Each request is claimed under
+	a row lock, so a follow-up worker running alongside never books it twice.
+	"""
+	from gms.gms.doctype.gym_class_booking.gym_class_booking import create_booking
+	
+	processed = 0
+	while True:
+		requests = frappe.get_all(
+			"Gym Booking Request",
+			filters={"slot_key": slot_key, "status": "Queued"},
+			fields=["name", "member", "gym_class", "class_date", "class_time", "join_waitlist"],
+			order_by="creation asc, name asc",
+			limit=100
+		)
+		if not requests:
+			return processed
+		
+		for request in requests:
+			if not _claim_request(request.name):
+				frappe.db.commit()
+				continue
+			
+			rolled_back = True
+			try:
+				result = create_booking(
+					request.member, request.gym_class, request.class_date, request.class_time, request.join_waitlist
+				)
+				rolled_back = False
+			except (frappe.QueryDeadlockError, frappe.QueryTimeoutError):
+				frappe.db.rollback()
+				return processed
+			except frappe.ValidationError as e:
+				frappe.db.rollback()
+				frappe.clear_last_message()
+				result = {"status": "error", "message": str(e)}
+			except Exception:
+				frappe.db.rollback()
+				frappe.log_error(title=_("Queued booking {0} failed").format(request.name))
+				result = {"status": "error", "message": _("Booking could not be processed")}
+			
+			# The rollback released the claim, another worker may have taken the request since
+			if rolled_back and not _claim_request(request.name):
+				frappe.db.commit()
+				continue
+			
+			status = {"success": "Booked", "waitlisted": "Waitlisted"}.get(result["status"], "Failed")
+			frappe.db.set_value(
+				"Gym Booking Request",
+				request.name,
+				{
+					"status": status,
+					"booking": result.get("booking_id"),
+					"message": result.get("message"),
+					"processed_at": now_datetime()
+				}
+			)
+			frappe.db.commit()
+			processed += 1
+
+
+def _claim_request(request_id):
+	"""Lock a booking request until the next commit, returning whether it is still queued"""
+	return frappe.db.get_value("Gym Booking Request", request_id, "status", for_update=True) == "Queued"
+
+
+def process_pending_booking_requests():
+	"""Restart workers for queues left with requests waiting over a minute"""
+	for slot_key in frappe.get_all(
+		"Gym Booking Request",
+		filters={"status": "Queued", "creation": ["<", add_to_date(now_datetime(), minutes=-1)]},
+		pluck="slot_key",
+		distinct=True
+	):
+		enqueue_slot_queue(slot_key)
+
+
+def get_request_status(request_id):
+	"""Get a booking request's outcome, or its place in the queue while waiting"""
+	request = frappe.db.get_value(
+		"Gym Booking Request",
+		request_id,
+		["name", "slot_key", "creation", "status", "booking", "message"],
+		as_dict=True
+	)
+	if not request:
+		frappe.throw(_("Booking request {0} not found").format(request_id), frappe.DoesNotExistError)
+	
+	status = {
+		"request_id": request.name,
+		"status": request.status,
+		"booking_id": request.booking,
+		"message": request.message
+	}
+	if request.status == "Queued":
+		status["queue_position"] = frappe.db.count(
+			"Gym Booking Request",
+			{"slot_key": request.slot_key, "status": "Queued", "creation": ["<=", request.creation]}
+		)
+	if request.booking and request.status == "Waitlisted":
+		booking = frappe.db.get_value(
+			"Gym Class Booking", request.booking, ["class_slot", "status", "waitlist_position"], as_dict=True
+		)
+		if booking and booking.status == "Waitlisted":
+			status["waitlist_position"] = get_waitlist_rank(booking.class_slot, booking.waitlist_position)
+	
+	return status
+
+
+@frappe.whitelist()
+def get_booking_request_status(request_id):
+	"""Poll the status of a queued class booking"""
+	return get_request_status(request_id)
+
+
+def on_doctype_update():
+	frappe.db.add_index("Gym Booking Request", ["slot_key", "status", "creation"])
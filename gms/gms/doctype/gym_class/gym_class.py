@@ -1,6 +1,35 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Count, IfNull, Sum
+from frappe.utils import add_days, cint, date_diff, flt, get_time, getdate, today
+
+from gms.gms.api.trainer_availability import invalidate_trainer_intervals, is_trainer_available
+from gms.gms.api.trainer_calendar import invalidate_trainer_calendar
+from gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup import (
+	REVENUE_STATUSES,
+	get_class_revenue_total,
+)
+from gms.gms.doctype.gym_class_slot.gym_class_slot import (
+	SEAT_HOLDING_STATUSES,
+	get_available_spots,
+	get_calendar_end,
+	sync_class_slots,
+	update_class_capacity,
+)
+
+# Booking status -> stats field counted by get_booking_stats
+BOOKING_STATUS_FIELDS = {
+	"Confirmed": "confirmed_bookings",
+	"Cancelled": "cancelled_bookings",
+	"Completed": "completed_bookings",
+	"No Show": "no_show_bookings",
+	"Waitlisted": "waitlisted_bookings"
+}
+
+# Redis hash of date -> class sessions with free seats, see get_cached_class_availability
+CLASS_AVAILABILITY_KEY = "gms:class_availability"
 
 
 class GymClass(Document):
@@ -9,6 +38,23 @@ class GymClass(Document):
 		self.validate_schedule()
 		self.validate_trainer_availability()
 
+	def on_update(self):
+		"""Regenerate upcoming class slots and propagate capacity changes"""
+		sync_class_slots(self)
+		if self.has_value_changed("max_capacity"):
+			update_class_capacity(self.name, self.max_capacity)
+		
+		# Schedule, capacity or status edits can change any date's availability
+		invalidate_class_availability()
+		previous = self.get_doc_before_save()
+		invalidate_trainer_intervals([self.trainer, previous.trainer if previous else None])
+		invalidate_trainer_calendar([self.trainer, previous.trainer if previous else None])
+
+	def on_trash(self):
+		invalidate_class_availability()
+		invalidate_trainer_intervals([self.trainer])
+		invalidate_trainer_calendar([self.trainer])
+
 	def validate_capacity(self):
 		"""Validate class capacity"""
 		if self.max_capacity <= 0:
@@ -29,40 +75,55 @@ class GymClass(Document):
 		if not self.trainer:
 			return
 		
-		trainer = frappe.get_doc("Gym Trainer", self.trainer)
-		
+		# The class's own saved sessions are on the trainer's schedule already
 		for schedule in self.schedule:
-			if schedule.is_active:
-				if not trainer.is_available(None, schedule.start_time, schedule.end_time):
+			if schedule.is_active and schedule.start_time and schedule.end_time:
+				if not is_trainer_available(
+					self.trainer, schedule.day_of_week, schedule.start_time, schedule.end_time, exclude_class=self.name
+				):
 					frappe.throw(_("Trainer {0} is not available at {1} on {2}").format(
 						self.trainer, schedule.start_time, schedule.day_of_week
 					))
 
 	def get_available_slots(self, date):
 		"""Get available booking slots for a specific date"""
+		if self.is_active and not self.is_new():
+			return [
+				{
+					"start_time": session["start_time"],
+					"end_time": session["end_time"],
+					"available_spots": session["available_spots"],
+					"max_capacity": session["max_capacity"],
+					"is_fully_booked": session["available_spots"] <= 0
+				}
+				for session in get_cached_class_availability(date)[str(getdate(date))]
+				if session["class_id"] == self.name
+			]
+		
 		day_of_week = frappe.utils.get_datetime(date).strftime("%A")
 		
+		# Seat counts for every slot of the day come from one query on the slot counters
+		booked_seats = {
+			get_time(slot.class_time): slot
+			for slot in frappe.get_all(
+				"Gym Class Slot",
+				filters={"gym_class": self.name, "class_date": date},
+				fields=["class_time", "capacity", "booked_count"]
+			)
+		}
+		
 		available_slots = []
 		for schedule in self.schedule:
 			if schedule.day_of_week == day_of_week and schedule.is_active:
-				# Check current bookings
-				bookings = frappe.get_all(
-					"Gym Class Booking",
-					filters={
-						"gym_class": self.name,
-						"class_date": date,
-						"class_time": schedule.start_time,
-						"status": "Confirmed"
-					}
-				)
-				
-				available_spots = self.max_capacity - len(bookings)
+				slot = booked_seats.get(get_time(schedule.start_time))
+				capacity = slot.capacity if slot else self.max_capacity
+				available_spots = capacity - (slot.booked_count if slot else 0)
 				
 				available_slots.append({
 					"start_time": schedule.start_time,
 					"end_time": schedule.end_time,
 					"available_spots": available_spots,
-					"max_capacity": self.max_capacity,
+					"max_capacity": capacity,
 					"is_fully_booked": available_spots <= 0
 				})
 		
@@ -70,51 +131,28 @@ class GymClass(Document):
 
 	def get_class_statistics(self):
 		"""Get class performance statistics"""
-		# Get total bookings
-		total_bookings = frappe.get_all(
-			"Gym Class Booking",
-			filters={"gym_class": self.name},
-			fields=["status"]
-		)
-		
-		# Get current month bookings
 		current_month = frappe.utils.today()[:7] + "-01"
-		current_month_bookings = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": self.name,
-				"class_date": [">=", current_month]
-			},
-			fields=["status"]
-		)
-		
-		# Calculate statistics
-		confirmed_bookings = len([b for b in total_bookings if b.status == "Confirmed"])
-		cancelled_bookings = len([b for b in total_bookings if b.status == "Cancelled"])
-		completed_bookings = len([b for b in total_bookings if b.status == "Completed"])
+		stats = get_booking_stats(gym_classes=[self.name], month_start=current_month).get(self.name)
+		if not stats:
+			stats = _booking_stats(frappe._dict(), month_start=current_month)
 		
 		return {
-			"total_bookings": len(total_bookings),
-			"confirmed_bookings": confirmed_bookings,
-			"cancelled_bookings": cancelled_bookings,
-			"completed_bookings": completed_bookings,
-			"current_month_bookings": len(current_month_bookings),
-			"attendance_rate": (completed_bookings / confirmed_bookings * 100) if confirmed_bookings > 0 else 0
+			"total_bookings": stats.total_bookings,
+			"confirmed_bookings": stats.confirmed_bookings,
+			"cancelled_bookings": stats.cancelled_bookings,
+			"completed_bookings": stats.completed_bookings,
+			"current_month_bookings": stats.current_month_bookings,
+			"attendance_rate": stats.attendance_rate
 		}
 
 	def is_fully_booked(self, date, start_time):
 		"""Check if class is fully booked for specific date and time"""
-		bookings = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": self.name,
-				"class_date": date,
-				"class_time": start_time,
-				"status": "Confirmed"
-			}
-		)
+		start_time = get_time(start_time)
+		for session in get_cached_class_availability(date)[str(getdate(date))]:
+			if session["class_id"] == self.name and get_time(session["start_time"]) == start_time:
+				return session["available_spots"] <= 0
 		
-		return len(bookings) >= self.max_capacity
+		return get_available_spots(self.name, date, start_time) <= 0
 
 	def get_class_revenue(self, start_date=None, end_date=None):
 		"""Get class revenue for a date range"""
@@ -123,18 +161,284 @@ class GymClass(Document):
 		if not end_date:
 			end_date = frappe.utils.today()
 		
-		bookings = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": self.name,
-				"class_date": ["between", [start_date, end_date]],
-				"status": "Confirmed"
-			},
-			fields=["amount_paid"]
+		return get_class_revenue_total(self.name, start_date, end_date)
+
+
+def get_booking_stats(gym_classes=None, start_date=None, end_date=None, month_start=None, by_class=True):
+	"""Aggregate booking status counts and revenue with one grouped query
+	
+	Returns a dict of class -> stats, or a single stats dict keyed by None when
+	``by_class`` is off. Revenue counts bookings in REVENUE_STATUSES.
+	"""
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	
+	def count_where(condition):
+		return Sum(Case().when(condition, 1).else_(0))
+	
+	query = frappe.qb.from_(Booking).select(
+		Count("*").as_("total_bookings"),
+		*(count_where(Booking.status == status).as_(field) for status, field in BOOKING_STATUS_FIELDS.items()),
+		Sum(Case().when(Booking.status.isin(REVENUE_STATUSES), IfNull(Booking.amount_paid, 0)).else_(0)).as_("revenue")
+	)
+	if month_start:
+		query = query.select(count_where(Booking.class_date >= getdate(month_start)).as_("current_month_bookings"))
+	if by_class:
+		query = query.select(Booking.gym_class).groupby(Booking.gym_class)
+	if gym_classes:
+		query = query.where(Booking.gym_class.isin(gym_classes))
+	if start_date:
+		query = query.where(Booking.class_date >= getdate(start_date))
+	if end_date:
+		query = query.where(Booking.class_date <= getdate(end_date))
+	
+	return {
+		row.get("gym_class"): _booking_stats(row, month_start)
+		for row in query.run(as_dict=True)
+	}
+
+
+def _booking_stats(row, month_start=None):
+	stats = frappe._dict({
+		"total_bookings": cint(row.get("total_bookings")),
+		**{field: cint(row.get(field)) for field in BOOKING_STATUS_FIELDS.values()},
+		"revenue": flt(row.get("revenue"))
+	})
+	if month_start:
+		stats.current_month_bookings = cint(row.get("current_month_bookings"))
+	# Share of finished sessions attended, Confirmed only holds upcoming sessions once attendance is finalized
+	finished = stats.completed_bookings + stats.no_show_bookings
+	stats.attendance_rate = (stats.completed_bookings / finished * 100) if finished else 0
+	return stats
+
+
+def get_class_availability(start_date, end_date=None):
+	"""Get every active class session with its free seats for a date range
+	
+	Dates inside the generated class calendar are read from Gym Class Slot with
+	one range scan. Other dates are derived from the schedules with a constant
+	number of queries: active classes joined with their schedule rows, the slot
+	counters for the range, and a grouped count of bookings not yet linked to a
+	slot. Returns a dict of date -> list of sessions ordered by start time.
+	"""
+	start_date = getdate(start_date)
+	end_date = getdate(end_date or start_date)
+	dates = [getdate(add_days(start_date, i)) for i in range(date_diff(end_date, start_date) + 1)]
+	availability = {str(date): [] for date in dates}
+	
+	calendar_start, calendar_end = getdate(today()), get_calendar_end()
+	slot_dates = [date for date in dates if calendar_start <= date <= calendar_end]
+	if slot_dates:
+		availability.update(_get_slot_availability(slot_dates[0], slot_dates[-1]))
+	
+	derived_dates = [date for date in dates if not calendar_start <= date <= calendar_end]
+	if derived_dates:
+		availability.update(_derive_class_availability(derived_dates))
+	
+	return availability
+
+
+def _get_slot_availability(start_date, end_date):
+	"""Read class sessions from the generated slots of a date range"""
+	availability = {}
+	for offset in range(date_diff(end_date, start_date) + 1):
+		availability[str(getdate(add_days(start_date, offset)))] = []
+	
+	GymClass = frappe.qb.DocType("Gym Class")
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	slots = (
+		frappe.qb.from_(Slot)
+		.join(GymClass)
+		.on(GymClass.name == Slot.gym_class)
+		.select(
+			Slot.gym_class,
+			Slot.class_date,
+			Slot.class_time,
+			Slot.end_time,
+			Slot.trainer,
+			Slot.capacity,
+			Slot.booked_count,
+			GymClass.class_name,
+			GymClass.class_type,
+			GymClass.duration_minutes,
+			GymClass.price,
+			GymClass.currency,
+			GymClass.class_level
 		)
-		
-		total_revenue = sum(booking.amount_paid or 0 for booking in bookings)
-		return total_revenue
+		.where(Slot.class_date.between(start_date, end_date))
+		.where(Slot.is_active == 1)
+		.where(GymClass.is_active == 1)
+		.orderby(Slot.class_date)
+		.orderby(Slot.class_time)
+		.orderby(GymClass.class_name)
+	).run(as_dict=True)
+	
+	for slot in slots:
+		availability[str(slot.class_date)].append({
+			"class_id": slot.gym_class,
+			"class_name": slot.class_name,
+			"class_type": slot.class_type,
+			"trainer": slot.trainer,
+			"start_time": slot.class_time,
+			"end_time": slot.end_time,
+			"duration": slot.duration_minutes,
+			"price": slot.price,
+			"currency": slot.currency,
+			"available_spots": max(slot.capacity - slot.booked_count, 0),
+			"max_capacity": slot.capacity,
+			"class_level": slot.class_level
+		})
+	
+	return availability
+
+
+def _derive_class_availability(dates):
+	"""Derive class sessions for dates outside the generated calendar from the schedules"""
+	start_date, end_date = dates[0], dates[-1]
+	availability = {str(date): [] for date in dates}
+	
+	GymClass = frappe.qb.DocType("Gym Class")
+	Schedule = frappe.qb.DocType("Gym Class Schedule")
+	sessions = (
+		frappe.qb.from_(GymClass)
+		.join(Schedule)
+		.on((Schedule.parent == GymClass.name) & (Schedule.parenttype == "Gym Class"))
+		.select(
+			GymClass.name,
+			GymClass.class_name,
+			GymClass.class_type,
+			GymClass.trainer,
+			GymClass.duration_minutes,
+			GymClass.price,
+			GymClass.currency,
+			GymClass.max_capacity,
+			GymClass.class_level,
+			Schedule.day_of_week,
+			Schedule.start_time,
+			Schedule.end_time
+		)
+		.where(GymClass.is_active == 1)
+		.where(Schedule.is_active == 1)
+		.where(Schedule.day_of_week.isin(list({date.strftime("%A") for date in dates})))
+		.orderby(Schedule.start_time)
+		.orderby(GymClass.class_name)
+	).run(as_dict=True)
+	if not sessions:
+		return availability
+	
+	booked = _get_booked_seats(list({s.name for s in sessions}), start_date, end_date)
+	
+	for date in dates:
+		day_of_week = date.strftime("%A")
+		for session in sessions:
+			if session.day_of_week != day_of_week:
+				continue
+			
+			capacity, booked_count = booked.get(
+				(session.name, str(date), get_time(session.start_time)), (session.max_capacity, 0)
+			)
+			availability[str(date)].append({
+				"class_id": session.name,
+				"class_name": session.class_name,
+				"class_type": session.class_type,
+				"trainer": session.trainer,
+				"start_time": session.start_time,
+				"end_time": session.end_time,
+				"duration": session.duration_minutes,
+				"price": session.price,
+				"currency": session.currency,
+				"available_spots": max(capacity - booked_count, 0),
+				"max_capacity": capacity,
+				"class_level": session.class_level
+			})
+	
+	return availability
+
+
+def get_cached_class_availability(start_date, end_date=None):
+	"""Get class availability for a date range, computing only the dates missing from the cache"""
+	start_date = getdate(start_date)
+	end_date = getdate(end_date or start_date)
+	dates = [str(getdate(add_days(start_date, i))) for i in range(date_diff(end_date, start_date) + 1)]
+	
+	cache = frappe.cache()
+	availability = {date: cache.hget(CLASS_AVAILABILITY_KEY, date) for date in dates}
+	missing = [date for date, sessions in availability.items() if sessions is None]
+	if missing:
+		computed = get_class_availability(missing[0], missing[-1])
+		for date in missing:
+			availability[date] = computed[date]
+			cache.hset(CLASS_AVAILABILITY_KEY, date, computed[date])
+	
+	return availability
+
+
+def invalidate_class_availability(dates=None):
+	"""Drop cached availability for some dates, or all of them, once the transaction commits"""
+	dates = [str(getdate(date)) for date in dates or [] if date]
+	
+	def clear_cache():
+		cache = frappe.cache()
+		if dates:
+			for date in dates:
+				cache.hdel(CLASS_AVAILABILITY_KEY, date)
+		else:
+			cache.delete_value(CLASS_AVAILABILITY_KEY)
+	
+	frappe.db.after_commit.add(clear_cache)
+
+
+def warm_class_availability_cache(days=7):
+	"""Rebuild the availability cache for the coming days, dropping past dates"""
+	frappe.cache().delete_value(CLASS_AVAILABILITY_KEY)
+	return get_cached_class_availability(today(), add_days(today(), days - 1))
+
+
+def _get_booked_seats(classes, start_date, end_date):
+	"""Map (class, date, time) to (capacity, booked seats) for a date range"""
+	booked = {}
+	for slot in frappe.get_all(
+		"Gym Class Slot",
+		filters={"gym_class": ["in", classes], "class_date": ["between", [start_date, end_date]]},
+		fields=["gym_class", "class_date", "class_time", "capacity", "booked_count"]
+	):
+		booked[(slot.gym_class, str(slot.class_date), get_time(slot.class_time))] = (slot.capacity, slot.booked_count)
+	
+	# Bookings made before their slot was created are not in any counter yet
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	unlinked = (
+		frappe.qb.from_(Booking)
+		.select(Booking.gym_class, Booking.class_date, Booking.class_time, Count("*").as_("seats"))
+		.where(Booking.gym_class.isin(classes))
+		.where(Booking.class_date.between(start_date, end_date))
+		.where(Booking.status.isin(SEAT_HOLDING_STATUSES))
+		.where(Booking.class_slot.isnull() | (Booking.class_slot == ""))
+		.groupby(Booking.gym_class, Booking.class_date, Booking.class_time)
+	).run(as_dict=True)
+	capacities = dict(frappe.get_all(
+		"Gym Class", filters={"name": ["in", classes]}, fields=["name", "max_capacity"], as_list=True
+	))
+	for row in unlinked:
+		key = (row.gym_class, str(row.class_date), get_time(row.class_time))
+		capacity, seats = booked.get(key, (capacities.get(row.gym_class) or 0, 0))
+		booked[key] = (capacity, seats + row.seats)
+	
+	return booked
+
+
+@frappe.whitelist()
+def get_class_overview(start_date=None, end_date=None):
+	"""Get booking statistics and revenue for every class in one pass"""
+	stats = get_booking_stats(start_date=start_date, end_date=end_date)
+	
+	overview = []
+	for class_doc in frappe.get_all(
+		"Gym Class",
+		fields=["name", "class_name", "class_type", "trainer", "max_capacity", "is_active"],
+		order_by="class_name"
+	):
+		overview.append({**class_doc, **(stats.get(class_doc.name) or _booking_stats(frappe._dict()))})
+	
+	return overview
 
 
 @frappe.whitelist()
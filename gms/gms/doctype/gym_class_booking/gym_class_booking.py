@@ -1,7 +1,35 @@
+import calendar
+from datetime import timedelta
+
 import frappe
 from frappe.model.document import Document
+from frappe.model.naming import make_autoname
 from frappe import _
-from frappe.utils import today, now_datetime
+from frappe.utils import add_days, cint, get_datetime, get_time, getdate, today, now_datetime
+
+from gms.gms.api.trainer_calendar import invalidate_trainer_calendar
+from gms.gms.doctype.gym_booking_request.gym_booking_request import is_queued_booking_enabled, queue_booking
+from gms.gms.doctype.gym_class.gym_class import get_booking_stats, invalidate_class_availability
+from gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup import (
+	add_bookings_revenue,
+	apply_booking_revenue,
+)
+from gms.gms.doctype.gym_class_slot.gym_class_slot import (
+	SEAT_HOLDING_STATUSES,
+	get_available_spots,
+	get_slot_key,
+	get_waitlist_rank,
+	join_waitlist,
+	leave_waitlist,
+	promote_waitlist,
+	release_seat,
+	reserve_seat,
+	reserve_seats,
+)
+from gms.gms.doctype.gym_member.gym_member import get_membership, membership_is_valid
+from gms.utils import bulk_insert_docs
+
+BOOKING_NAMING_SERIES = "GCB-.YYYY.-.#####"
 
 
 class GymClassBooking(Document):
@@ -13,27 +41,35 @@ class GymClassBooking(Document):
 
 	def validate_member_membership(self):
 		"""Validate member's membership status"""
-		member = frappe.get_doc("Gym Member", self.member)
-		if not member.is_membership_valid():
+		if not self.is_new() and not self.has_value_changed("member"):
+			return
+		
+		if not membership_is_valid(get_membership(self.member)):
 			frappe.throw(_("Member's membership is not valid. Please check membership status."))
 
 	def validate_class_capacity(self):
-		"""Validate class capacity"""
-		class_doc = frappe.get_doc("Gym Class", self.gym_class)
+		"""Reserve or release the seat in the class slot as the booking changes"""
+		previous = self.get_doc_before_save()
+		previous_status = previous.status if previous else None
+		held_seat = previous_status in SEAT_HOLDING_STATUSES and previous.class_slot
+		holds_seat = self.status in SEAT_HOLDING_STATUSES
+		slot_key = get_slot_key(self.gym_class, self.class_date, self.class_time)
 		
-		# Check if class is fully booked
-		existing_bookings = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": self.gym_class,
-				"class_date": self.class_date,
-				"class_time": self.class_time,
-				"status": "Confirmed"
-			}
-		)
+		if held_seat and (not holds_seat or previous.class_slot != slot_key):
+			release_seat(previous.class_slot)
+			self.flags.released_slot = previous.class_slot
+			held_seat = False
+		
+		was_waitlisted = previous_status == "Waitlisted" and previous.class_slot == slot_key
+		if previous_status == "Waitlisted" and not (was_waitlisted and self.status == "Waitlisted"):
+			leave_waitlist(previous.class_slot)
+			self.waitlist_position = None
+			was_waitlisted = False
 		
-		if len(existing_bookings) >= class_doc.max_capacity:
-			frappe.throw(_("Class is fully booked for this time slot"))
+		if holds_seat and not held_seat:
+			self.class_slot = reserve_seat(self.gym_class, self.class_date, self.class_time)
+		elif self.status == "Waitlisted" and not was_waitlisted:
+			self.class_slot, self.waitlist_position = join_waitlist(self.gym_class, self.class_date, self.class_time)
 
 	def validate_booking_time(self):
 		"""Validate booking time is not in the past"""
@@ -46,6 +82,28 @@ class GymClassBooking(Document):
 		if not self.booking_date:
 			self.booking_date = now_datetime()
 
+	def on_update(self):
+		"""Hand a released seat to the next waitlisted booking"""
+		if self.flags.released_slot:
+			promote_waitlist(self.flags.released_slot)
+		
+		previous = self.get_doc_before_save()
+		apply_booking_revenue(self, previous)
+		invalidate_class_availability([self.class_date, previous.class_date if previous else None])
+		invalidate_trainer_calendar([frappe.get_cached_value("Gym Class", self.gym_class, "trainer")])
+
+	def on_trash(self):
+		"""Give the booking's seat or waitlist place back to its slot"""
+		if self.status in SEAT_HOLDING_STATUSES and self.class_slot:
+			release_seat(self.class_slot)
+			promote_waitlist(self.class_slot)
+		elif self.status == "Waitlisted":
+			leave_waitlist(self.class_slot)
+		
+		apply_booking_revenue(None, self)
+		invalidate_class_availability([self.class_date])
+		invalidate_trainer_calendar([frappe.get_cached_value("Gym Class", self.gym_class, "trainer")])
+
 	def on_submit(self):
 		"""Update class statistics when booking is confirmed"""
 		self.update_class_statistics()
@@ -103,8 +161,17 @@ class GymClassBooking(Document):
 
 
 @frappe.whitelist()
-def book_class(member_id, class_id, class_date, class_time):
-	"""Book a class for a member"""
+def book_class(member_id, class_id, class_date, class_time, join_waitlist=0):
+	"""Book a class for a member, optionally joining the waitlist when it is full"""
+	if is_queued_booking_enabled():
+		request = queue_booking(member_id, class_id, class_date, class_time, join_waitlist)
+		return {"status": "queued", "message": "Booking request queued", "request_id": request.name}
+	
+	return create_booking(member_id, class_id, class_date, class_time, join_waitlist)
+
+
+def create_booking(member_id, class_id, class_date, class_time, join_waitlist=0):
+	"""Validate and insert a class booking, returning a status dict"""
 	# Validate member
 	member = frappe.get_doc("Gym Member", member_id)
 	if not member.is_membership_valid():
@@ -117,9 +184,12 @@ def book_class(member_id, class_id, class_date, class_time):
 	if not class_doc.is_active:
 		return {"status": "error", "message": "Class is not active"}
 	
-	# Check capacity
-	if class_doc.is_fully_booked(class_date, class_time):
-		return {"status": "error", "message": "Class is fully booked"}
+	# Check capacity, the seat itself is reserved under lock when the booking is inserted
+	status = "Confirmed"
+	if not get_available_spots(class_id, class_date, class_time):
+		if not cint(join_waitlist):
+			return {"status": "error", "message": "Class is fully booked"}
+		status = "Waitlisted"
 	
 	# Check if member already booked this class
 	existing_booking = frappe.get_all(
@@ -142,12 +212,20 @@ def book_class(member_id, class_id, class_date, class_time):
 		"gym_class": class_id,
 		"class_date": class_date,
 		"class_time": class_time,
-		"status": "Confirmed",
+		"status": status,
 		"amount_paid": class_doc.price,
 		"currency": class_doc.currency
 	})
 	booking.insert()
 	
+	if booking.status == "Waitlisted":
+		return {
+			"status": "waitlisted",
+			"message": "Class is fully booked, added to the waitlist",
+			"booking_id": booking.name,
+			"waitlist_position": get_waitlist_rank(booking.class_slot, booking.waitlist_position)
+		}
+	
 	return {
 		"status": "success",
 		"message": "Class booked successfully",
@@ -155,6 +233,93 @@ def book_class(member_id, class_id, class_date, class_time):
 	}
 
 
+def book_series(member_id, class_id, day_of_week, class_time, occurrences, start_date=None):
+	"""Book the same weekly session of a class for a number of weeks
+	
+	The member and class are validated once, seats for every week are reserved
+	through ``reserve_seats`` and the bookings are inserted in one statement.
+	Weeks that are full or already booked by the member are skipped and
+	reported back.
+	"""
+	occurrences = cint(occurrences)
+	if occurrences <= 0 or occurrences > 52:
+		frappe.throw(_("Occurrences must be between 1 and 52"))
+	
+	if not membership_is_valid(get_membership(member_id)):
+		frappe.throw(_("Member's membership is not valid. Please check membership status."))
+	
+	class_doc = frappe.get_cached_doc("Gym Class", class_id)
+	if not class_doc.is_active:
+		frappe.throw(_("Class is not active"))
+	
+	class_time = get_time(class_time)
+	if not any(
+		s.is_active and s.day_of_week == day_of_week and get_time(s.start_time) == class_time
+		for s in class_doc.schedule
+	):
+		frappe.throw(_("{0} has no session on {1} at {2}").format(class_id, day_of_week, class_time))
+	
+	# First matching weekday on or after the start date that is still in the future
+	first_date = getdate(start_date or today())
+	weekday = list(calendar.day_name).index(day_of_week)
+	first_date = add_days(first_date, (weekday - first_date.weekday()) % 7)
+	if get_datetime(f"{first_date} {class_time}") < now_datetime():
+		first_date = add_days(first_date, 7)
+	dates = [getdate(add_days(first_date, 7 * week)) for week in range(occurrences)]
+	
+	already_booked = {
+		str(b.class_date)
+		for b in frappe.get_all(
+			"Gym Class Booking",
+			filters={
+				"member": member_id,
+				"gym_class": class_id,
+				"class_date": ["in", dates],
+				"class_time": class_time,
+				"status": ["!=", "Cancelled"]
+			},
+			fields=["class_date"]
+		)
+	}
+	sessions = [(date, class_time) for date in dates if str(date) not in already_booked]
+	reserved, full = reserve_seats(class_id, sessions) if sessions else ({}, [])
+	
+	now = now_datetime()
+	bookings = [
+		{
+			"name": make_autoname(BOOKING_NAMING_SERIES, "Gym Class Booking"),
+			"naming_series": "GCB-.YYYY.-",
+			"member": member_id,
+			"gym_class": class_id,
+			"class_date": date,
+			"class_time": class_time,
+			"class_slot": slot,
+			"status": "Confirmed",
+			"booking_date": now,
+			"payment_status": "Pending",
+			"amount_paid": class_doc.price,
+			"currency": class_doc.currency
+		}
+		for (date, time), slot in sorted(reserved.items())
+	]
+	bulk_insert_docs("Gym Class Booking", bookings)
+	add_bookings_revenue([frappe._dict(b) for b in bookings])
+	invalidate_class_availability([b["class_date"] for b in bookings])
+	invalidate_trainer_calendar([class_doc.trainer])
+	
+	return {
+		"booked": [{"booking_id": b["name"], "class_date": str(b["class_date"])} for b in bookings],
+		"full": sorted(str(date) for date, time in full),
+		"already_booked": sorted(already_booked)
+	}
+
+
+@frappe.whitelist()
+def book_class_series(member_id, class_id, day_of_week, class_time, occurrences, start_date=None):
+	"""Book a weekly class session for a number of weeks"""
+	return book_series(member_id, class_id, day_of_week, class_time, occurrences, start_date)
+
+
 @frappe.whitelist()
 def cancel_booking(booking_id, reason=None):
 	"""Cancel a class booking"""
@@ -202,25 +367,109 @@ def get_booking_statistics(start_date=None, end_date=None):
 	if not end_date:
 		end_date = today()
 	
-	bookings = frappe.get_all(
-		"Gym Class Booking",
-		filters={
-			"class_date": ["between", [start_date, end_date]]
-		},
-		fields=["status"]
-	)
-	
-	total_bookings = len(bookings)
-	confirmed_bookings = len([b for b in bookings if b.status == "Confirmed"])
-	cancelled_bookings = len([b for b in bookings if b.status == "Cancelled"])
-	completed_bookings = len([b for b in bookings if b.status == "Completed"])
-	no_show_bookings = len([b for b in bookings if b.status == "No Show"])
+	stats = get_booking_stats(start_date=start_date, end_date=end_date, by_class=False)[None]
 	
 	return {
-		"total_bookings": total_bookings,
-		"confirmed_bookings": confirmed_bookings,
-		"cancelled_bookings": cancelled_bookings,
-		"completed_bookings": completed_bookings,
-		"no_show_bookings": no_show_bookings,
-		"attendance_rate": (completed_bookings / confirmed_bookings * 100) if confirmed_bookings > 0 else 0
+		"total_bookings": stats.total_bookings,
+		"confirmed_bookings": stats.confirmed_bookings,
+		"cancelled_bookings": stats.cancelled_bookings,
+		"completed_bookings": stats.completed_bookings,
+		"no_show_bookings": stats.no_show_bookings,
+		"attendance_rate": stats.attendance_rate
 	}
+
+
+def finalize_class_attendance(batch_size=1000):
+	"""Mark confirmed bookings of finished sessions Completed or No Show
+	
+	A booking counts as attended when its member has a Gym Visit on the class
+	date. Finished bookings are read in keyset batches with their slot end time,
+	matched against visits with one query per batch and finalized with one
+	update per outcome.
+	"""
+	now = now_datetime()
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	GymClass = frappe.qb.DocType("Gym Class")
+	query = (
+		frappe.qb.from_(Booking)
+		.left_join(Slot)
+		.on(Slot.name == Booking.class_slot)
+		.left_join(GymClass)
+		.on(GymClass.name == Booking.gym_class)
+		.select(
+			Booking.name,
+			Booking.member,
+			Booking.class_date,
+			Booking.class_time,
+			Slot.end_time,
+			GymClass.duration_minutes
+		)
+		.where(Booking.status == "Confirmed")
+		.where(Booking.class_date <= now.date())
+		.orderby(Booking.name)
+		.limit(batch_size)
+	)
+	
+	finalized = 0
+	last_name = None
+	while True:
+		batch_query = query if last_name is None else query.where(Booking.name > last_name)
+		bookings = batch_query.run(as_dict=True)
+		if not bookings:
+			break
+		
+		finished = [b for b in bookings if _get_session_end(b) <= now]
+		if finished:
+			attended = {
+				(v.member, str(v.visit_date))
+				for v in frappe.get_all(
+					"Gym Visit",
+					filters={
+						"member": ["in", list({b.member for b in finished})],
+						"visit_date": ["in", list({b.class_date for b in finished})]
+					},
+					fields=["member", "visit_date"],
+					distinct=True
+				)
+			}
+			
+			outcomes = {"Completed": [], "No Show": []}
+			for booking in finished:
+				status = "Completed" if (booking.member, str(booking.class_date)) in attended else "No Show"
+				outcomes[status].append(booking.name)
+			
+			for status, names in outcomes.items():
+				if names:
+					(
+						frappe.qb.update(Booking)
+						.set(Booking.status, status)
+						.set(Booking.modified, now)
+						.where(Booking.name.isin(names))
+						.where(Booking.status == "Confirmed")
+					).run()
+			
+			frappe.db.commit()
+			finalized += len(finished)
+		
+		if len(bookings) < batch_size:
+			break
+		last_name = bookings[-1].name
+	
+	return finalized
+
+
+def _get_session_end(booking):
+	"""End of a booked session, from its slot or else the class duration"""
+	start = get_datetime(f"{booking.class_date} {booking.class_time}")
+	if booking.end_time:
+		end = get_datetime(f"{booking.class_date} {booking.end_time}")
+		if end > start:
+			return end
+	
+	return start + timedelta(minutes=cint(booking.duration_minutes))
+
+
+def on_doctype_update():
+	frappe.db.add_index("Gym Class Booking", ["class_slot", "status", "waitlist_position"])
+	frappe.db.add_index("Gym Class Booking", ["status", "class_date"])
@@ -0,0 +1,182 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.query_builder.functions import Count, IfNull, Max, Min, Sum
+from frappe.utils import add_days, flt, getdate, today
+
+from gms.utils import bulk_insert_docs, increment_counter
+
+# Booking statuses whose amount counts as class revenue
+REVENUE_STATUSES = ("Confirmed", "Completed", "No Show")
+
+REVENUE_DIMENSIONS = ("gym_class", "trainer", "class_type")
+
+
+class GymClassRevenueRollup(Document):
+	pass
+
+
+def get_revenue_key(revenue_date, gym_class):
+	return f"{revenue_date}-{gym_class}"
+
+
+def _revenue_values(revenue_date, gym_class):
+	class_doc = frappe.get_cached_doc("Gym Class", gym_class)
+	return {
+		"revenue_key": get_revenue_key(revenue_date, gym_class),
+		"revenue_date": revenue_date,
+		"gym_class": gym_class,
+		"trainer": class_doc.trainer,
+		"class_type": class_doc.class_type
+	}
+
+
+def _booking_revenue(booking):
+	"""Map (date, class) to [bookings, revenue] for a booking that counts as revenue"""
+	if not booking or booking.get("status") not in REVENUE_STATUSES:
+		return {}
+	
+	return {(str(booking.class_date), booking.gym_class): [1, flt(booking.amount_paid)]}
+
+
+def apply_booking_revenue(booking, previous=None):
+	"""Apply the change in a booking's revenue to the rollup
+	
+	``previous`` is the booking as it was before the save (None for new
+	bookings), and passing ``booking=None`` removes a deleted booking.
+	"""
+	before, after = _booking_revenue(previous), _booking_revenue(booking)
+	for key in before.keys() | after.keys():
+		bookings = after.get(key, [0, 0])[0] - before.get(key, [0, 0])[0]
+		revenue = after.get(key, [0, 0])[1] - before.get(key, [0, 0])[1]
+		if bookings or revenue:
+			_apply(key, bookings, revenue)
+
+
+def add_bookings_revenue(bookings):
+	"""Add bookings written without their controller to the rollup"""
+	totals = {}
+	for booking in bookings:
+		for key, (count, revenue) in _booking_revenue(booking).items():
+			counts = totals.setdefault(key, [0, 0])
+			counts[0] += count
+			counts[1] += revenue
+	
+	for key, (count, revenue) in totals.items():
+		_apply(key, count, revenue)
+
+
+def _apply(key, bookings, revenue):
+	increment_counter(
+		"Gym Class Revenue Rollup",
+		get_revenue_key(*key),
+		{"bookings": bookings, "revenue": revenue},
+		_revenue_values(*key)
+	)
+
+
+def rebuild_revenue_rollups(start_date=None, end_date=None):
+	"""Rebuild the revenue rollup from Gym Class Booking
+	
+	Run with ``bench execute gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup.rebuild_revenue_rollups``
+	to backfill. The range is aggregated with a single grouped join on Gym Class.
+	"""
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	if not start_date or not end_date:
+		bounds = frappe.qb.from_(Booking).select(Min(Booking.class_date), Max(Booking.class_date)).run()
+		if not bounds or not bounds[0][0]:
+			return 0
+		start_date = start_date or bounds[0][0]
+		end_date = end_date or bounds[0][1]
+	
+	start_date, end_date = getdate(start_date), getdate(end_date)
+	GymClass = frappe.qb.DocType("Gym Class")
+	rows = (
+		frappe.qb.from_(Booking)
+		.join(GymClass)
+		.on(GymClass.name == Booking.gym_class)
+		.select(
+			Booking.class_date,
+			Booking.gym_class,
+			GymClass.trainer,
+			GymClass.class_type,
+			Count("*").as_("bookings"),
+			Sum(IfNull(Booking.amount_paid, 0)).as_("revenue")
+		)
+		.where(Booking.class_date.between(start_date, end_date))
+		.where(Booking.status.isin(REVENUE_STATUSES))
+		.groupby(Booking.class_date, Booking.gym_class, GymClass.trainer, GymClass.class_type)
+	).run(as_dict=True)
+	
+	frappe.db.delete("Gym Class Revenue Rollup", {"revenue_date": ["between", [start_date, end_date]]})
+	bulk_insert_docs(
+		"Gym Class Revenue Rollup",
+		[
+			{
+				"name": get_revenue_key(row.class_date, row.gym_class),
+				"revenue_key": get_revenue_key(row.class_date, row.gym_class),
+				"revenue_date": row.class_date,
+				"gym_class": row.gym_class,
+				"trainer": row.trainer,
+				"class_type": row.class_type,
+				"bookings": row.bookings,
+				"revenue": flt(row.revenue)
+			}
+			for row in rows
+		]
+	)
+	frappe.db.commit()
+	return len(rows)
+
+
+def get_class_revenue_total(gym_class, start_date, end_date):
+	"""Sum a class's rolled up revenue over a date range"""
+	Rollup = frappe.qb.DocType("Gym Class Revenue Rollup")
+	revenue = (
+		frappe.qb.from_(Rollup)
+		.select(Sum(Rollup.revenue))
+		.where(Rollup.gym_class == gym_class)
+		.where(Rollup.revenue_date.between(getdate(start_date), getdate(end_date)))
+	).run()
+	
+	return flt(revenue[0][0]) if revenue else 0
+
+
+@frappe.whitelist()
+def get_revenue_report(start_date=None, end_date=None, group_by="gym_class", period="month"):
+	"""Get class revenue sliced by period and by class, trainer or class type"""
+	if not start_date:
+		start_date = add_days(today(), -29)
+	if not end_date:
+		end_date = today()
+	
+	if group_by not in REVENUE_DIMENSIONS:
+		frappe.throw(_("Revenue can be grouped by {0}").format(", ".join(REVENUE_DIMENSIONS)))
+	if period not in ("day", "month", "total"):
+		frappe.throw(_("Period must be day, month or total"))
+	
+	Rollup = frappe.qb.DocType("Gym Class Revenue Rollup")
+	dimension = Rollup[group_by]
+	rows = (
+		frappe.qb.from_(Rollup)
+		.select(
+			Rollup.revenue_date,
+			dimension.as_("dimension"),
+			Sum(Rollup.bookings).as_("bookings"),
+			Sum(Rollup.revenue).as_("revenue")
+		)
+		.where(Rollup.revenue_date.between(getdate(start_date), getdate(end_date)))
+		.groupby(Rollup.revenue_date, dimension)
+	).run(as_dict=True)
+	
+	# Days are folded into months here, the rows are already bounded by days x dimension values
+	report = {}
+	for row in rows:
+		bucket = {"day": str(row.revenue_date), "month": str(row.revenue_date)[:7], "total": None}[period]
+		entry = report.setdefault(
+			(bucket, row.dimension), {"period": bucket, group_by: row.dimension, "bookings": 0, "revenue": 0}
+		)
+		entry["bookings"] += int(row.bookings or 0)
+		entry["revenue"] += flt(row.revenue)
+	
+	return sorted(report.values(), key=lambda e: (e["period"] or "", -e["revenue"]))
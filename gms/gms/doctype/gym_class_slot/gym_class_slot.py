@@ -0,0 +1,463 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+from frappe.utils import add_days, cint, date_diff, get_time, getdate, now_datetime, today
+
+from gms.gms.api.trainer_calendar import invalidate_trainer_calendar
+from gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup import add_bookings_revenue
+from gms.utils import bulk_insert_docs
+
+# Booking statuses that occupy a seat in their slot
+SEAT_HOLDING_STATUSES = ("Confirmed", "Completed", "No Show")
+
+SLOT_FIELDS = [
+	"name", "gym_class", "class_date", "class_time", "capacity", "booked_count",
+	"waitlist_count", "last_waitlist_position", "is_active"
+]
+
+DEFAULT_CALENDAR_WEEKS = 8
+
+
+class ClassFullError(frappe.ValidationError):
+	pass
+
+
+class GymClassSlot(Document):
+	def validate(self):
+		self.validate_capacity()
+
+	def validate_capacity(self):
+		"""Validate slot capacity"""
+		if self.capacity <= 0:
+			frappe.throw(_("Capacity must be greater than 0"))
+
+
+def get_slot_key(gym_class, class_date, class_time):
+	return f"{gym_class}-{getdate(class_date)}-{get_time(class_time).strftime('%H:%M')}"
+
+
+def get_slot(gym_class, class_date, class_time, for_update=False):
+	"""Get a class slot, creating it from the class and existing bookings if missing"""
+	name = get_slot_key(gym_class, class_date, class_time)
+	slot = frappe.db.get_value("Gym Class Slot", name, SLOT_FIELDS, as_dict=True, for_update=for_update)
+	if slot:
+		return slot
+	
+	# Bookings made before the slot existed are counted once and linked to it
+	existing_bookings = {
+		"gym_class": gym_class,
+		"class_date": getdate(class_date),
+		"class_time": get_time(class_time),
+		"status": ["in", SEAT_HOLDING_STATUSES],
+		"class_slot": ["is", "not set"]
+	}
+	
+	class_doc = frappe.get_cached_doc("Gym Class", gym_class)
+	end_time = next(
+		(s.end_time for s in class_doc.schedule if get_time(s.start_time) == get_time(class_time)), None
+	)
+	
+	frappe.db.savepoint("gms_class_slot")
+	try:
+		frappe.get_doc({
+			"doctype": "Gym Class Slot",
+			"slot_key": name,
+			"gym_class": gym_class,
+			"class_date": getdate(class_date),
+			"class_time": get_time(class_time),
+			"end_time": end_time,
+			"trainer": class_doc.trainer,
+			"capacity": class_doc.max_capacity,
+			"booked_count": frappe.db.count("Gym Class Booking", existing_bookings)
+		}).insert(ignore_permissions=True)
+		frappe.db.set_value("Gym Class Booking", existing_bookings, "class_slot", name, update_modified=False)
+	except frappe.DuplicateEntryError:
+		# Created by a concurrent booking in the meantime
+		frappe.db.rollback(save_point="gms_class_slot")
+		frappe.clear_last_message()
+	
+	return frappe.db.get_value("Gym Class Slot", name, SLOT_FIELDS, as_dict=True, for_update=for_update)
+
+
+def get_available_spots(gym_class, class_date, class_time):
+	"""Get the number of free seats in a slot without locking or creating it"""
+	slot = frappe.db.get_value(
+		"Gym Class Slot", get_slot_key(gym_class, class_date, class_time), SLOT_FIELDS, as_dict=True
+	)
+	if slot:
+		return max(slot.capacity - slot.booked_count, 0)
+	
+	capacity = frappe.db.get_value("Gym Class", gym_class, "max_capacity") or 0
+	booked = frappe.db.count(
+		"Gym Class Booking",
+		{
+			"gym_class": gym_class,
+			"class_date": getdate(class_date),
+			"class_time": get_time(class_time),
+			"status": ["in", SEAT_HOLDING_STATUSES]
+		}
+	)
+	return max(capacity - booked, 0)
+
+
+def reserve_seat(gym_class, class_date, class_time):
+	"""Reserve a seat in a slot inside the current transaction
+	
+	The slot row stays locked until the booking commits, so concurrent bookings
+	of the same slot are checked one after the other against the real count.
+	"""
+	slot = get_slot(gym_class, class_date, class_time, for_update=True)
+	if not slot.is_active:
+		frappe.throw(_("Class is no longer scheduled at this time"))
+	if slot.booked_count >= slot.capacity:
+		frappe.throw(_("Class is fully booked for this time slot"), ClassFullError)
+	
+	_add_booked_seats(slot.name, 1)
+	return slot.name
+
+
+def reserve_seats(gym_class, sessions):
+	"""Reserve one seat in each of several slots of a class inside the current transaction
+	
+	``sessions`` is a list of (class_date, class_time). All the slot rows are
+	locked and checked with one query and booked with one update. Returns a
+	dict of session -> slot name for the reserved seats and a list of the
+	sessions that were full.
+	"""
+	keys = {get_slot_key(gym_class, date, time): (date, time) for date, time in sessions}
+	existing = set(frappe.get_all("Gym Class Slot", filters={"name": ["in", list(keys)]}, pluck="name"))
+	for key in keys.keys() - existing:
+		get_slot(gym_class, *keys[key])
+	
+	slots = frappe.get_all(
+		"Gym Class Slot",
+		filters={"name": ["in", list(keys)]},
+		fields=SLOT_FIELDS,
+		for_update=True
+	)
+	
+	reserved, full = {}, []
+	for slot in slots:
+		if not slot.is_active or slot.booked_count >= slot.capacity:
+			full.append(keys[slot.name])
+		else:
+			reserved[keys[slot.name]] = slot.name
+	
+	if reserved:
+		Slot = frappe.qb.DocType("Gym Class Slot")
+		(
+			frappe.qb.update(Slot)
+			.set(Slot.booked_count, Slot.booked_count + 1)
+			.where(Slot.name.isin(list(reserved.values())))
+		).run()
+	
+	return reserved, full
+
+
+def release_seat(slot_name):
+	"""Give back a seat reserved in a slot"""
+	if slot_name:
+		_add_booked_seats(slot_name, -1)
+
+
+def _add_booked_seats(slot_name, seats):
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	query = frappe.qb.update(Slot).set(Slot.booked_count, Slot.booked_count + seats).where(Slot.name == slot_name)
+	if seats < 0:
+		query = query.where(Slot.booked_count >= -seats)
+	query.run()
+
+
+def join_waitlist(gym_class, class_date, class_time):
+	"""Append a booking to the slot's waitlist, returning the slot and queue position"""
+	slot = get_slot(gym_class, class_date, class_time, for_update=True)
+	position = (slot.last_waitlist_position or 0) + 1
+	
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	(
+		frappe.qb.update(Slot)
+		.set(Slot.waitlist_count, Slot.waitlist_count + 1)
+		.set(Slot.last_waitlist_position, position)
+		.where(Slot.name == slot.name)
+	).run()
+	
+	return slot.name, position
+
+
+def get_waitlist_rank(slot_name, waitlist_position):
+	"""Get a waitlisted booking's place in line among the bookings still waiting
+	
+	``waitlist_position`` only orders the queue, it is never renumbered when
+	bookings ahead are promoted or leave.
+	"""
+	return frappe.db.count(
+		"Gym Class Booking",
+		{"class_slot": slot_name, "status": "Waitlisted", "waitlist_position": ["<=", waitlist_position]}
+	)
+
+
+def leave_waitlist(slot_name, bookings=1):
+	"""Remove bookings from the slot's waitlist count"""
+	if not slot_name:
+		return
+	
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	(
+		frappe.qb.update(Slot)
+		.set(Slot.waitlist_count, Slot.waitlist_count - bookings)
+		.where(Slot.name == slot_name)
+		.where(Slot.waitlist_count >= bookings)
+	).run()
+
+
+def promote_waitlist(slot_name):
+	"""Confirm waitlisted bookings in queue order into the slot's free seats
+	
+	The first waitlisted bookings are picked with one query on the
+	(class_slot, status, waitlist_position) index and confirmed with one update,
+	however many seats opened up.
+	"""
+	slot = frappe.db.get_value("Gym Class Slot", slot_name, SLOT_FIELDS, as_dict=True, for_update=True)
+	if not slot or not slot.waitlist_count:
+		return []
+	
+	free_seats = slot.capacity - slot.booked_count
+	if free_seats <= 0:
+		return []
+	
+	bookings = frappe.get_all(
+		"Gym Class Booking",
+		filters={"class_slot": slot_name, "status": "Waitlisted"},
+		fields=["name", "gym_class", "class_date", "amount_paid"],
+		order_by="waitlist_position asc",
+		limit=free_seats
+	)
+	if not bookings:
+		return []
+	
+	promoted = [b.name for b in bookings]
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	(
+		frappe.qb.update(Booking)
+		.set(Booking.status, "Confirmed")
+		.set(Booking.waitlist_position, None)
+		.set(Booking.modified, now_datetime())
+		.where(Booking.name.isin(promoted))
+	).run()
+	
+	_add_booked_seats(slot_name, len(promoted))
+	leave_waitlist(slot_name, len(promoted))
+	for booking in bookings:
+		booking.status = "Confirmed"
+	add_bookings_revenue(bookings)
+	return promoted
+
+
+def update_class_capacity(gym_class, capacity):
+	"""Apply a new max capacity to the class's upcoming slots and fill new seats from waitlists"""
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	(
+		frappe.qb.update(Slot)
+		.set(Slot.capacity, capacity)
+		.where(Slot.gym_class == gym_class)
+		.where(Slot.class_date >= getdate(today()))
+	).run()
+	
+	waitlisted_slots = frappe.get_all(
+		"Gym Class Slot",
+		filters={
+			"gym_class": gym_class,
+			"class_date": [">=", today()],
+			"waitlist_count": [">", 0]
+		},
+		pluck="name"
+	)
+	
+	promoted = []
+	for slot_name in waitlisted_slots:
+		promoted += promote_waitlist(slot_name)
+	
+	return promoted
+
+
+def get_calendar_weeks():
+	return cint(frappe.db.get_single_value("Gym Settings", "class_calendar_weeks")) or DEFAULT_CALENDAR_WEEKS
+
+
+def get_calendar_end():
+	"""Last date up to which class slots are generated"""
+	return getdate(add_days(today(), get_calendar_weeks() * 7 - 1))
+
+
+def sync_class_slots(gym_class, weeks=None):
+	"""Generate a class's slots from its schedule for the coming weeks
+	
+	Only the difference is written: missing slots are bulk inserted, slots whose
+	end time or trainer moved are updated, and slots no longer on the
+	schedule are deactivated (their bookings are kept). Returns the number of
+	slots inserted and updated.
+	"""
+	class_doc = frappe.get_doc("Gym Class", gym_class) if isinstance(gym_class, str) else gym_class
+	start_date = getdate(today())
+	end_date = getdate(add_days(start_date, (weeks or get_calendar_weeks()) * 7 - 1))
+	
+	expected = {}
+	if class_doc.is_active:
+		sessions = {}
+		for schedule in class_doc.schedule:
+			if schedule.is_active and schedule.start_time:
+				sessions.setdefault(schedule.day_of_week, []).append(schedule)
+		
+		for offset in range(date_diff(end_date, start_date) + 1):
+			date = getdate(add_days(start_date, offset))
+			for schedule in sessions.get(date.strftime("%A"), []):
+				expected[get_slot_key(class_doc.name, date, schedule.start_time)] = {
+					"class_date": date,
+					"class_time": get_time(schedule.start_time),
+					"end_time": get_time(schedule.end_time) if schedule.end_time else None
+				}
+	
+	existing = {
+		slot.name: slot
+		for slot in frappe.get_all(
+			"Gym Class Slot",
+			filters={"gym_class": class_doc.name, "class_date": ["between", [start_date, end_date]]},
+			fields=["name", "end_time", "trainer", "is_active"]
+		)
+	}
+	
+	new_slots = [
+		{
+			"name": key,
+			"slot_key": key,
+			"gym_class": class_doc.name,
+			**session,
+			"trainer": class_doc.trainer,
+			"capacity": class_doc.max_capacity,
+			"booked_count": 0,
+			"waitlist_count": 0,
+			"last_waitlist_position": 0,
+			"is_active": 1
+		}
+		for key, session in expected.items()
+		if key not in existing
+	]
+	bulk_insert_docs("Gym Class Slot", new_slots)
+	_link_unslotted_bookings(class_doc.name, [slot["name"] for slot in new_slots])
+	
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	updated = 0
+	for name, slot in existing.items():
+		session = expected.get(name)
+		if session:
+			values = {"is_active": 1, "end_time": session["end_time"], "trainer": class_doc.trainer}
+		else:
+			values = {"is_active": 0}
+		
+		current = {
+			"is_active": slot.is_active,
+			"end_time": get_time(slot.end_time) if slot.end_time else None,
+			"trainer": slot.trainer
+		}
+		if all(current[field] == value for field, value in values.items()):
+			continue
+		
+		query = frappe.qb.update(Slot).where(Slot.name == name)
+		for field, value in values.items():
+			query = query.set(Slot[field], value)
+		query.run()
+		updated += 1
+	
+	if new_slots or updated:
+		invalidate_trainer_calendar([class_doc.trainer, *(slot.trainer for slot in existing.values())])
+	
+	return len(new_slots) + updated
+
+
+def _link_unslotted_bookings(gym_class, slot_names):
+	"""Count and link seat-holding bookings made before their newly generated slots existed"""
+	if not slot_names:
+		return
+	
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	rows = (
+		frappe.qb.from_(Booking)
+		.select(Booking.name, Booking.class_date, Booking.class_time)
+		.where(Booking.gym_class == gym_class)
+		.where(Booking.class_date >= getdate(today()))
+		.where(Booking.status.isin(SEAT_HOLDING_STATUSES))
+		.where(Booking.class_slot.isnull() | (Booking.class_slot == ""))
+	).run(as_dict=True)
+	
+	slot_names = set(slot_names)
+	bookings = {}
+	for row in rows:
+		key = get_slot_key(gym_class, row.class_date, row.class_time)
+		if key in slot_names:
+			bookings.setdefault(key, []).append(row.name)
+	
+	for slot_name, names in bookings.items():
+		frappe.db.set_value("Gym Class Booking", {"name": ["in", names]}, "class_slot", slot_name, update_modified=False)
+		_add_booked_seats(slot_name, len(names))
+
+
+def generate_class_slots():
+	"""Roll the generated class calendar forward for every class"""
+	weeks = get_calendar_weeks()
+	for gym_class in frappe.get_all("Gym Class", pluck="name"):
+		sync_class_slots(gym_class, weeks)
+		frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_class_calendar(start_date=None, end_date=None, gym_class=None, trainer=None):
+	"""Get the generated class slots in a date range with their seat counts"""
+	if not start_date:
+		start_date = today()
+	if not end_date:
+		end_date = add_days(start_date, 6)
+	
+	if date_diff(end_date, start_date) < 0:
+		frappe.throw(_("End date must be on or after start date"))
+	if date_diff(end_date, start_date) > 62:
+		frappe.throw(_("Date range cannot be longer than 63 days"))
+	
+	Slot = frappe.qb.DocType("Gym Class Slot")
+	GymClass = frappe.qb.DocType("Gym Class")
+	query = (
+		frappe.qb.from_(Slot)
+		.join(GymClass)
+		.on(GymClass.name == Slot.gym_class)
+		.select(
+			Slot.name.as_("slot"),
+			Slot.gym_class.as_("class_id"),
+			GymClass.class_name,
+			GymClass.class_type,
+			Slot.trainer,
+			Slot.class_date,
+			Slot.class_time,
+			Slot.end_time,
+			Slot.capacity,
+			Slot.booked_count,
+			Slot.waitlist_count
+		)
+		.where(Slot.class_date.between(getdate(start_date), getdate(end_date)))
+		.where(Slot.is_active == 1)
+		.orderby(Slot.class_date)
+		.orderby(Slot.class_time)
+	)
+	if gym_class:
+		query = query.where(Slot.gym_class == gym_class)
+	if trainer:
+		query = query.where(Slot.trainer == trainer)
+	
+	calendar = query.run(as_dict=True)
+	for slot in calendar:
+		slot.available_spots = max(slot.capacity - slot.booked_count, 0)
+	
+	return calendar
+
+
+def on_doctype_update():
+	frappe.db.add_index("Gym Class Slot", ["gym_class", "class_date"])
+	frappe.db.add_index("Gym Class Slot", ["class_date", "class_time"])
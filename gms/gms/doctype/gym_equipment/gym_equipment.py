@@ -1,8 +1,13 @@
 import frappe
 from frappe.model.document import Document
-from frappe.utils import today, add_days, add_months
+from frappe.utils import today, add_days, add_months, date_diff
 from frappe import _
 
+from gms.gms.doctype.gym_equipment_usage_rollup.gym_equipment_usage_rollup import (
+	get_usage_by_hour,
+	get_usage_summary,
+)
+
 
 class GymEquipment(Document):
 	def validate(self):
@@ -100,12 +105,24 @@ class GymEquipment(Document):
 
 	def get_usage_statistics(self):
 		"""Get usage statistics for this equipment"""
-		# This would integrate with gym visit tracking
-		# For now, return basic info
+		hours = get_usage_by_hour(self.name)
+		total_minutes = sum(hour.usage_minutes or 0 for hour in hours)
+		first_used = min((hour.first_used for hour in hours), default=None)
+		days_in_service = date_diff(today(), first_used) + 1 if first_used else 0
+		
 		return {
-			"total_usage_hours": 0,  # Would be calculated from visit logs
-			"average_daily_usage": 0,
-			"last_used": None
+			"total_usage_hours": round(total_minutes / 60, 2),
+			"average_daily_usage": round(total_minutes / 60 / days_in_service, 2) if days_in_service else 0,
+			"last_used": max((hour.last_used for hour in hours), default=None),
+			"total_sessions": sum(hour.sessions or 0 for hour in hours),
+			"hourly_profile": [
+				{
+					"hour": hour.hour,
+					"usage_hours": round((hour.usage_minutes or 0) / 60, 2),
+					"sessions": hour.sessions or 0
+				}
+				for hour in hours
+			]
 		}
 
 	def is_available(self):
@@ -178,3 +195,21 @@ def get_equipment_dashboard_data():
 		"out_of_order": out_of_order,
 		"operational_percentage": (operational / total_equipment * 100) if total_equipment > 0 else 0
 	}
+
+
+@frappe.whitelist()
+def get_equipment_usage_dashboard(start_date=None, end_date=None):
+	"""Get usage totals for all equipment from the usage rollup"""
+	usage = get_usage_summary(start_date, end_date)
+	
+	return [
+		{
+			"equipment": row.equipment,
+			"total_usage_hours": round((row.usage_minutes or 0) / 60, 2),
+			"sessions": row.sessions or 0,
+			"days_used": row.days_used,
+			"average_usage_hours_per_day_used": round((row.usage_minutes or 0) / 60 / row.days_used, 2) if row.days_used else 0,
+			"last_used": row.last_used
+		}
+		for row in usage
+	]
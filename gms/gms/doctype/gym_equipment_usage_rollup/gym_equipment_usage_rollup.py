@@ -0,0 +1,167 @@
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Count, Max, Min, Sum
+from frappe.utils import add_days, get_time, getdate
+
+from gms.utils import bulk_insert_docs, increment_counter
+
+
+class GymEquipmentUsageRollup(Document):
+	pass
+
+
+def get_usage_key(equipment, usage_date, hour):
+	return f"{equipment}-{usage_date}-{int(hour):02d}"
+
+
+def _usage_values(equipment, usage_date, hour):
+	return {
+		"usage_key": get_usage_key(equipment, usage_date, hour),
+		"equipment": equipment,
+		"usage_date": usage_date,
+		"hour": hour
+	}
+
+
+def _visit_usage(visit):
+	"""Map (equipment, date, hour) to [minutes, sessions] for a visit's equipment rows"""
+	usage = {}
+	if not visit or not visit.check_in_time:
+		return usage
+	
+	visit_date, hour = str(visit.visit_date), get_time(visit.check_in_time).hour
+	for row in visit.get("equipment_used") or []:
+		if not row.equipment:
+			continue
+		counts = usage.setdefault((row.equipment, visit_date, hour), [0, 0])
+		counts[0] += row.usage_duration_minutes or 0
+		counts[1] += 1
+	
+	return usage
+
+
+def apply_visit_usage(visit, previous=None):
+	"""Apply the change in a visit's equipment usage to the rollup
+	
+	``previous`` is the visit as it was before the save (None for new visits), and
+	passing ``visit=None`` removes a deleted visit's usage.
+	"""
+	before, after = _visit_usage(previous), _visit_usage(visit)
+	for key in before.keys() | after.keys():
+		minutes = after.get(key, [0, 0])[0] - before.get(key, [0, 0])[0]
+		sessions = after.get(key, [0, 0])[1] - before.get(key, [0, 0])[1]
+		if not minutes and not sessions:
+			continue
+		
+		increment_counter(
+			"Gym Equipment Usage Rollup",
+			get_usage_key(*key),
+			{"usage_minutes": minutes, "sessions": sessions},
+			_usage_values(*key)
+		)
+
+
+def rebuild_equipment_usage(start_date=None, end_date=None, chunk_days=31):
+	"""Rebuild the equipment usage rollup from Gym Visit Equipment
+	
+	Run with ``bench execute gms.gms.doctype.gym_equipment_usage_rollup.gym_equipment_usage_rollup.rebuild_equipment_usage``
+	to backfill. Each month is aggregated with a single grouped join.
+	"""
+	if not start_date or not end_date:
+		Visit = frappe.qb.DocType("Gym Visit")
+		bounds = frappe.qb.from_(Visit).select(Min(Visit.visit_date), Max(Visit.visit_date)).run()
+		if not bounds or not bounds[0][0]:
+			return 0
+		start_date = start_date or bounds[0][0]
+		end_date = end_date or bounds[0][1]
+	
+	rebuilt = 0
+	chunk_start = getdate(start_date)
+	end_date = getdate(end_date)
+	while chunk_start <= end_date:
+		chunk_end = min(getdate(add_days(chunk_start, chunk_days - 1)), end_date)
+		rebuilt += _rebuild_chunk(chunk_start, chunk_end)
+		frappe.db.commit()
+		chunk_start = getdate(add_days(chunk_end, 1))
+	
+	return rebuilt
+
+
+def _rebuild_chunk(start_date, end_date):
+	Visit = frappe.qb.DocType("Gym Visit")
+	Usage = frappe.qb.DocType("Gym Visit Equipment")
+	rows = (
+		frappe.qb.from_(Usage)
+		.join(Visit)
+		.on(Usage.parent == Visit.name)
+		.select(
+			Usage.equipment,
+			Visit.visit_date,
+			Visit.check_in_time,
+			Usage.usage_duration_minutes
+		)
+		.where(Usage.parenttype == "Gym Visit")
+		.where(Visit.visit_date.between(start_date, end_date))
+	).run(as_dict=True)
+	
+	totals = {}
+	for row in rows:
+		key = (row.equipment, str(row.visit_date), get_time(row.check_in_time).hour)
+		counts = totals.setdefault(key, [0, 0])
+		counts[0] += row.usage_duration_minutes or 0
+		counts[1] += 1
+	
+	frappe.db.delete("Gym Equipment Usage Rollup", {"usage_date": ["between", [start_date, end_date]]})
+	bulk_insert_docs(
+		"Gym Equipment Usage Rollup",
+		[
+			{
+				"name": get_usage_key(*key),
+				**_usage_values(*key),
+				"usage_minutes": minutes,
+				"sessions": sessions
+			}
+			for key, (minutes, sessions) in totals.items()
+		]
+	)
+	return len(totals)
+
+
+def get_usage_by_hour(equipment):
+	"""Get total usage per hour of day for an equipment with one grouped query"""
+	Rollup = frappe.qb.DocType("Gym Equipment Usage Rollup")
+	return (
+		frappe.qb.from_(Rollup)
+		.select(
+			Rollup.hour,
+			Sum(Rollup.usage_minutes).as_("usage_minutes"),
+			Sum(Rollup.sessions).as_("sessions"),
+			Min(Rollup.usage_date).as_("first_used"),
+			Max(Rollup.usage_date).as_("last_used")
+		)
+		.where(Rollup.equipment == equipment)
+		.groupby(Rollup.hour)
+		.orderby(Rollup.hour)
+	).run(as_dict=True)
+
+
+def get_usage_summary(start_date=None, end_date=None):
+	"""Get usage totals for every equipment with one grouped query"""
+	Rollup = frappe.qb.DocType("Gym Equipment Usage Rollup")
+	query = (
+		frappe.qb.from_(Rollup)
+		.select(
+			Rollup.equipment,
+			Sum(Rollup.usage_minutes).as_("usage_minutes"),
+			Sum(Rollup.sessions).as_("sessions"),
+			Count(Rollup.usage_date).distinct().as_("days_used"),
+			Max(Rollup.usage_date).as_("last_used")
+		)
+		.groupby(Rollup.equipment)
+	)
+	if start_date:
+		query = query.where(Rollup.usage_date >= getdate(start_date))
+	if end_date:
+		query = query.where(Rollup.usage_date <= getdate(end_date))
+	
+	return query.run(as_dict=True)
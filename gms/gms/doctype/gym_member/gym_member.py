@@ -1,7 +1,14 @@
 import frappe
 from frappe.model.document import Document
-from frappe.utils import today, now_datetime, add_days, get_datetime
+from frappe.utils import today, now_datetime, add_days, get_datetime, getdate
 from frappe import _
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Concat, Count, IfNull, Max
+
+
+# Columns needed to decide whether a member may check in or book, so hot paths
+# can fetch them with a single projected query instead of loading the full doc
+MEMBERSHIP_FIELDS = ["name", "membership_type", "membership_end_date", "is_active"]
 
 
 class GymMember(Document):
@@ -57,7 +64,7 @@ class GymMember(Document):
 		"""Record a gym visit for this member"""
 		self.last_visit = now_datetime()
 		self.total_visits = (self.total_visits or 0) + 1
-		self.save()
+		record_member_visits([frappe._dict(member=self.name, visit_datetime=self.last_visit)])
 
 	def get_membership_days_remaining(self):
 		"""Get number of days remaining in membership"""
@@ -69,10 +76,7 @@ class GymMember(Document):
 
 	def is_membership_valid(self):
 		"""Check if membership is currently valid"""
-		if not self.membership_end_date:
-			return False
-		
-		return self.membership_end_date >= today() and self.is_active
+		return membership_is_valid(self)
 
 	def extend_membership(self, days):
 		"""Extend membership by specified number of days"""
@@ -101,6 +105,80 @@ class GymMember(Document):
 			frappe.throw(_("Cannot reactivate expired membership"))
 
 
+def get_membership(member_id, for_update=False):
+	"""Fetch only the membership columns of a member, optionally locking the row"""
+	return frappe.db.get_value(
+		"Gym Member", member_id, MEMBERSHIP_FIELDS, as_dict=True, for_update=for_update
+	)
+
+
+def membership_is_valid(member):
+	"""Check membership validity on a Gym Member doc or a projected row"""
+	if not member or not member.membership_end_date:
+		return False
+	
+	return getdate(member.membership_end_date) >= getdate(today()) and bool(member.is_active)
+
+
+def record_member_visits(visits):
+	"""Increment visit counters of the visiting members in place
+	
+	Counters are bumped with one column update per member instead of saving the
+	member, so visits skip validation and version tracking and do not hold the
+	member row for long. ``visits`` need ``member`` and either ``visit_datetime``
+	or ``visit_date`` and ``check_in_time``.
+	"""
+	counts = {}
+	for visit in visits:
+		visit_datetime = visit.get("visit_datetime") or get_datetime(f"{visit.visit_date} {visit.check_in_time}")
+		count, last_visit = counts.get(visit.member, (0, visit_datetime))
+		counts[visit.member] = (count + 1, max(last_visit, visit_datetime))
+	
+	Member = frappe.qb.DocType("Gym Member")
+	for member, (count, last_visit) in counts.items():
+		(
+			frappe.qb.update(Member)
+			.set(Member.total_visits, IfNull(Member.total_visits, 0) + count)
+			.set(
+				Member.last_visit,
+				Case().when(Member.last_visit.isnull() | (Member.last_visit < last_visit), last_visit)
+				.else_(Member.last_visit)
+			)
+			.where(Member.name == member)
+		).run()
+
+
+def reconcile_member_visit_counters():
+	"""Recompute total_visits and last_visit of every member from Gym Visit"""
+	Visit = frappe.qb.DocType("Gym Visit")
+	actual = {
+		row.member: row
+		for row in (
+			frappe.qb.from_(Visit)
+			.select(
+				Visit.member,
+				Count("*").as_("total_visits"),
+				Max(Concat(Visit.visit_date, " ", Visit.check_in_time)).as_("last_visit")
+			)
+			.groupby(Visit.member)
+		).run(as_dict=True)
+	}
+	
+	updates = {}
+	for member in frappe.get_all("Gym Member", fields=["name", "total_visits", "last_visit"]):
+		row = actual.get(member.name)
+		total_visits = row.total_visits if row else 0
+		last_visit = get_datetime(row.last_visit) if row else None
+		
+		if (member.total_visits or 0) != total_visits or (last_visit and member.last_visit != last_visit):
+			updates[member.name] = {"total_visits": total_visits, "last_visit": last_visit or member.last_visit}
+	
+	if updates:
+		frappe.db.bulk_update("Gym Member", updates, update_modified=False)
+	
+	return len(updates)
+
+
 @frappe.whitelist()
 def get_member_dashboard_data(member_id):
 	"""Get dashboard data for a specific member"""
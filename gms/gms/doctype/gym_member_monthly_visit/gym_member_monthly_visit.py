@@ -0,0 +1,134 @@
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Count
+from frappe.utils import get_first_day, get_last_day, getdate, today
+
+from gms.utils import bulk_insert_docs, increment_counter
+
+
+class GymMemberMonthlyVisit(Document):
+	pass
+
+
+def get_counter_key(member, visit_date=None):
+	return f"{member}-{getdate(visit_date or today()).strftime('%Y-%m')}"
+
+
+def get_monthly_visit_count(member, visit_date=None, for_update=False):
+	"""Get the number of visits a member has made in the month of a date"""
+	return frappe.db.get_value(
+		"Gym Member Monthly Visit", get_counter_key(member, visit_date), "visit_count", for_update=for_update
+	) or 0
+
+
+def get_monthly_visit_counts(members, visit_dates=None, for_update=False):
+	"""Get visit counts of several members for the months of several dates with one query
+	
+	Returns a dict of (member, first day of the month) -> visit count, defaulting
+	to the current month.
+	"""
+	months = list({get_first_day(visit_date) for visit_date in visit_dates or [today()]})
+	return {
+		(row.member, getdate(row.month)): row.visit_count
+		for row in frappe.get_all(
+			"Gym Member Monthly Visit",
+			filters={"member": ["in", list(members)], "month": ["in", months]},
+			fields=["member", "month", "visit_count"],
+			for_update=for_update
+		)
+	}
+
+
+def is_visit_allowed(member, visits_this_month=None, visit_date=None, for_update=False):
+	"""Check a member's membership plan quota for one more visit
+	
+	``member`` is a Gym Member doc or a row with ``name`` and ``membership_type``.
+	Unlimited plans are answered from the cached plan without a counter lookup,
+	and ``for_update`` reads the counter with a locking read.
+	"""
+	if not member.membership_type:
+		return True
+	
+	plan = frappe.get_cached_doc("Gym Membership Plan", member.membership_type)
+	if plan.unlimited_visits:
+		return True
+	
+	if visits_this_month is None:
+		visits_this_month = get_monthly_visit_count(member.name, visit_date, for_update)
+	
+	return plan.is_visit_allowed(visits_this_month)
+
+
+def record_monthly_visits(visits):
+	"""Increment the monthly visit counters of the visiting members"""
+	counts = {}
+	for visit in visits:
+		key = (visit.member, get_first_day(visit.visit_date))
+		counts[key] = counts.get(key, 0) + 1
+	
+	for (member, month), count in counts.items():
+		increment_counter(
+			"Gym Member Monthly Visit",
+			get_counter_key(member, month),
+			{"visit_count": count},
+			{"counter_key": get_counter_key(member, month), "member": member, "month": month}
+		)
+
+
+def rebuild_monthly_visit_counts(visit_date=None):
+	"""Recount the monthly visit counters of a month from Gym Visit
+	
+	Only counters that differ from the recount are written, so the job does not
+	lock the month's counters that check-ins keep incrementing.
+	"""
+	month = get_first_day(visit_date or today())
+	
+	Visit = frappe.qb.DocType("Gym Visit")
+	counts = {
+		get_counter_key(row.member, month): row
+		for row in (
+			frappe.qb.from_(Visit)
+			.select(Visit.member, Count("*").as_("visit_count"))
+			.where(Visit.visit_date.between(month, get_last_day(month)))
+			.groupby(Visit.member)
+		).run(as_dict=True)
+	}
+	stored = dict(frappe.get_all(
+		"Gym Member Monthly Visit",
+		filters={"month": month},
+		fields=["name", "visit_count"],
+		as_list=True
+	))
+	
+	stale = [name for name in stored if name not in counts]
+	if stale:
+		frappe.db.delete("Gym Member Monthly Visit", {"name": ["in", stale]})
+	
+	updates = {
+		name: {"visit_count": row.visit_count}
+		for name, row in counts.items()
+		if name in stored and stored[name] != row.visit_count
+	}
+	if updates:
+		frappe.db.bulk_update("Gym Member Monthly Visit", updates)
+	
+	bulk_insert_docs(
+		"Gym Member Monthly Visit",
+		[
+			{
+				"name": name,
+				"counter_key": name,
+				"member": row.member,
+				"month": month,
+				"visit_count": row.visit_count
+			}
+			for name, row in counts.items()
+			if name not in stored
+		]
+	)
+	
+	return len(counts)
+
+
+def on_doctype_update():
+	frappe.db.add_index("Gym Member Monthly Visit", ["month", "member"])
@@ -0,0 +1,27 @@
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+
+class GymSettings(Document):
+	def validate(self):
+		self.validate_auto_checkout()
+		self.validate_class_calendar()
+
+	def validate_auto_checkout(self):
+		"""Validate auto check-out cutoff"""
+		if self.enable_auto_checkout and (self.auto_checkout_after_hours or 0) <= 0:
+			frappe.throw(_("Auto check out hours must be greater than 0"))
+
+	def validate_class_calendar(self):
+		"""Validate how far ahead class slots are generated"""
+		if (self.class_calendar_weeks or 0) <= 0:
+			frappe.throw(_("Class slot weeks ahead must be greater than 0"))
+
+
+def set_default_settings():
+	"""Store the defaults of Gym Settings fields that have never been saved"""
+	saved = frappe.db.get_singles_dict("Gym Settings")
+	for df in frappe.get_meta("Gym Settings").fields:
+		if df.default is not None and df.fieldname not in saved:
+			frappe.db.set_single_value("Gym Settings", df.fieldname, df.default)
@@ -1,6 +1,19 @@
 import frappe
 from frappe.model.document import Document
 from frappe import _
+from frappe.query_builder import Case
+from frappe.query_builder.functions import Count, IfNull, Sum
+from frappe.utils import cint, flt, getdate
+
+from gms.gms.api.trainer_availability import (
+	format_minutes,
+	get_available_trainer_names,
+	get_trainer_intervals,
+	invalidate_trainer_intervals,
+	is_trainer_available,
+)
+from gms.gms.api.trainer_calendar import get_trainer_calendar, invalidate_trainer_calendar
+from gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup import REVENUE_STATUSES
 
 
 class GymTrainer(Document):
@@ -32,97 +45,105 @@ class GymTrainer(Document):
 			fields=["*"]
 		)
 
+	def on_update(self):
+		invalidate_trainer_intervals([self.name])
+		invalidate_trainer_calendar([self.name])
+
+	def on_trash(self):
+		invalidate_trainer_intervals([self.name])
+		invalidate_trainer_calendar([self.name])
+
 	def get_trainer_schedule(self, date=None):
 		"""Get trainer's schedule for a specific date"""
 		if not date:
 			date = frappe.utils.today()
 		
 		day_of_week = frappe.utils.get_datetime(date).strftime("%A")
-		
-		# Get working hours for the day
-		working_hours = []
-		if self.working_hours:
-			for hour in self.working_hours:
-				if hour.day_of_week == day_of_week and hour.is_active:
-					working_hours.append({
-						"start_time": hour.start_time,
-						"end_time": hour.end_time
-					})
-		
-		# Get classes for the day
-		classes = frappe.get_all(
-			"Gym Class",
-			filters={"trainer": self.name, "is_active": 1},
-			fields=["*"]
-		)
-		
-		scheduled_classes = []
-		for class_doc in classes:
-			class_info = frappe.get_doc("Gym Class", class_doc.name)
-			for schedule in class_info.schedule:
-				if schedule.day_of_week == day_of_week and schedule.is_active:
-					scheduled_classes.append({
-						"class_name": class_doc.class_name,
-						"start_time": schedule.start_time,
-						"end_time": schedule.end_time,
-						"class_type": class_doc.class_type
-					})
+		day = get_trainer_intervals([self.name])[self.name][day_of_week]
 		
 		return {
-			"working_hours": working_hours,
-			"scheduled_classes": scheduled_classes
+			"working_hours": [
+				{"start_time": format_minutes(start), "end_time": format_minutes(end)}
+				for start, end in day["working"]
+			],
+			"scheduled_classes": [
+				{
+					"class_name": class_name,
+					"start_time": format_minutes(start),
+					"end_time": format_minutes(end),
+					"class_type": class_type
+				}
+				for start, end, class_id, class_name, class_type in day["classes"]
+			]
 		}
 
-	def is_available(self, date, start_time, end_time):
+	def is_available(self, date, start_time, end_time, exclude_class=None):
 		"""Check if trainer is available at specific time"""
-		schedule = self.get_trainer_schedule(date)
-		
-		# Check if within working hours
-		within_working_hours = False
-		for hour in schedule["working_hours"]:
-			if start_time >= hour["start_time"] and end_time <= hour["end_time"]:
-				within_working_hours = True
-				break
-		
-		if not within_working_hours:
-			return False
-		
-		# Check for class conflicts
-		for class_info in schedule["scheduled_classes"]:
-			if (start_time < class_info["end_time"] and end_time > class_info["start_time"]):
-				return False
-		
-		return True
+		day_of_week = frappe.utils.get_datetime(date or frappe.utils.today()).strftime("%A")
+		return is_trainer_available(self.name, day_of_week, start_time, end_time, exclude_class)
 
 	def get_trainer_statistics(self):
 		"""Get trainer performance statistics"""
-		# Get total classes conducted
-		total_classes = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": ["in", [c.name for c in self.get_available_classes()]],
-				"status": "Completed"
-			}
-		)
-		
-		# Get current month classes
-		current_month = frappe.utils.today()[:7] + "-01"
-		current_month_classes = frappe.get_all(
-			"Gym Class Booking",
-			filters={
-				"gym_class": ["in", [c.name for c in self.get_available_classes()]],
-				"status": "Completed",
-				"class_date": [">=", current_month]
-			}
-		)
-		
+		stats = get_trainer_stats([self.name])[self.name]
 		return {
-			"total_classes": len(total_classes),
-			"current_month_classes": len(current_month_classes),
-			"assigned_classes": len(self.get_available_classes())
+			"total_classes": stats.total_classes,
+			"current_month_classes": stats.current_month_classes,
+			"assigned_classes": stats.assigned_classes,
+			"attendance_rate": stats.attendance_rate,
+			"revenue": stats.revenue
 		}
 
 
+def get_trainer_stats(trainers=None):
+	"""Aggregate completed sessions, attendance and revenue per trainer with one grouped join
+	
+	Counts cover the trainer's active classes. Attendance is completed bookings
+	over finalized (Completed or No Show) bookings.
+	"""
+	current_month = getdate(frappe.utils.today()[:7] + "-01")
+	GymClass = frappe.qb.DocType("Gym Class")
+	Booking = frappe.qb.DocType("Gym Class Booking")
+	
+	def count_where(condition):
+		return Sum(Case().when(condition, 1).else_(0))
+	
+	query = (
+		frappe.qb.from_(GymClass)
+		.left_join(Booking)
+		.on(Booking.gym_class == GymClass.name)
+		.select(
+			GymClass.trainer,
+			Count(GymClass.name).distinct().as_("assigned_classes"),
+			count_where(Booking.status == "Completed").as_("total_classes"),
+			count_where((Booking.status == "Completed") & (Booking.class_date >= current_month)).as_("current_month_classes"),
+			count_where(Booking.status == "No Show").as_("no_shows"),
+			Sum(Case().when(Booking.status.isin(REVENUE_STATUSES), IfNull(Booking.amount_paid, 0)).else_(0)).as_("revenue")
+		)
+		.where(GymClass.is_active == 1)
+		.where(GymClass.trainer.isnotnull())
+		.groupby(GymClass.trainer)
+	)
+	if trainers:
+		query = query.where(GymClass.trainer.isin(trainers))
+	
+	rows = {row.trainer: row for row in query.run(as_dict=True)}
+	
+	stats = {}
+	for trainer in trainers or rows:
+		row = rows.get(trainer) or {}
+		completed, no_shows = cint(row.get("total_classes")), cint(row.get("no_shows"))
+		stats[trainer] = frappe._dict({
+			"assigned_classes": cint(row.get("assigned_classes")),
+			"total_classes": completed,
+			"current_month_classes": cint(row.get("current_month_classes")),
+			"no_shows": no_shows,
+			"attendance_rate": (completed / (completed + no_shows) * 100) if completed + no_shows else 0,
+			"revenue": flt(row.get("revenue"))
+		})
+	
+	return stats
+
+
 @frappe.whitelist()
 def get_available_trainers(date=None, start_time=None, end_time=None):
 	"""Get trainers available at specific time"""
@@ -135,26 +156,42 @@ def get_available_trainers(date=None, start_time=None, end_time=None):
 		fields=["*"]
 	)
 	
-	available_trainers = []
-	for trainer in trainers:
-		trainer_doc = frappe.get_doc("Gym Trainer", trainer.name)
-		if start_time and end_time:
-			if trainer_doc.is_available(date, start_time, end_time):
-				available_trainers.append(trainer)
-		else:
-			available_trainers.append(trainer)
+	if not (start_time and end_time):
+		return trainers
+	
+	# Every trainer is checked against the shared interval index, built in two queries on a miss
+	day_of_week = frappe.utils.get_datetime(date).strftime("%A")
+	available = set(get_available_trainer_names([t.name for t in trainers], day_of_week, start_time, end_time))
+	return [trainer for trainer in trainers if trainer.name in available]
+
+
+@frappe.whitelist()
+def get_trainer_leaderboard(limit=None):
+	"""Get statistics for every active trainer, most completed sessions first"""
+	trainers = frappe.get_all("Gym Trainer", filters={"is_active": 1}, fields=["name", "first_name", "last_name"])
+	stats = get_trainer_stats([t.name for t in trainers]) if trainers else {}
 	
-	return available_trainers
+	leaderboard = sorted(
+		(
+			{"trainer": t.name, "trainer_name": " ".join(filter(None, [t.first_name, t.last_name])), **stats[t.name]}
+			for t in trainers
+		),
+		key=lambda row: (-row["total_classes"], -row["attendance_rate"], row["trainer"])
+	)
+	return leaderboard[:cint(limit)] if cint(limit) else leaderboard
 
 
 @frappe.whitelist()
 def get_trainer_dashboard_data(trainer_id):
 	"""Get dashboard data for a specific trainer"""
 	trainer = frappe.get_doc("Gym Trainer", trainer_id)
+	calendar = get_trainer_calendar(trainer_id)["calendar"]
+	day = next(d for d in calendar["days"] if d["date"] == frappe.utils.today())
 	
 	return {
 		"trainer": trainer,
 		"statistics": trainer.get_trainer_statistics(),
 		"assigned_classes": trainer.get_available_classes(),
-		"schedule": trainer.get_trainer_schedule()
+		"schedule": {"working_hours": day["working_hours"], "scheduled_classes": day["sessions"]},
+		"calendar": calendar
 	}
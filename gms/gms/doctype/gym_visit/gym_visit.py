@@ -1,8 +1,41 @@
+from datetime import timedelta
+
 import frappe
 from frappe.model.document import Document
-from frappe.utils import today, now_datetime, get_datetime
+from frappe.model.naming import make_autoname
+from frappe.utils import cint, today, now_datetime, get_datetime, get_first_day, getdate
 from frappe import _
 
+from gms.gms.api.occupancy import add_open_visits, get_open_visit_entry, remove_open_visits
+from gms.gms.doctype.gym_equipment_usage_rollup import gym_equipment_usage_rollup as equipment_usage
+from gms.gms.doctype.gym_member.gym_member import (
+	MEMBERSHIP_FIELDS,
+	get_membership,
+	membership_is_valid,
+	record_member_visits,
+)
+from gms.gms.doctype.gym_member_monthly_visit.gym_member_monthly_visit import (
+	get_monthly_visit_counts,
+	is_visit_allowed,
+	record_monthly_visits,
+)
+from gms.gms.doctype.gym_visit_daily_rollup import gym_visit_daily_rollup as visit_rollup
+from gms.utils import bulk_insert_docs
+
+VISIT_NAMING_SERIES = "GV-.YYYY.-.#####"
+
+
+class MembershipNotValidError(frappe.ValidationError):
+	pass
+
+
+class AlreadyCheckedInError(frappe.ValidationError):
+	pass
+
+
+class VisitLimitReachedError(frappe.ValidationError):
+	pass
+
 
 class GymVisit(Document):
 	def validate(self):
@@ -12,9 +45,16 @@ class GymVisit(Document):
 
 	def validate_member_membership(self):
 		"""Validate member's membership status"""
-		member = frappe.get_doc("Gym Member", self.member)
-		if not member.is_membership_valid():
+		# check_in has already validated the member under a row lock
+		if self.flags.membership_validated:
+			return
+		
+		member = get_membership(self.member)
+		if not membership_is_valid(member):
 			frappe.throw(_("Member's membership is not valid. Please check membership status."))
+		
+		if self.is_new() and not is_visit_allowed(member, visit_date=self.visit_date):
+			frappe.throw(_("Monthly visit limit of the membership plan has been reached"), VisitLimitReachedError)
 
 	def validate_visit_times(self):
 		"""Validate check-in and check-out times"""
@@ -25,28 +65,38 @@ class GymVisit(Document):
 	def calculate_duration(self):
 		"""Calculate visit duration in minutes"""
 		if self.check_in_time and self.check_out_time:
-			check_in_datetime = get_datetime(f"{self.visit_date} {self.check_in_time}")
-			check_out_datetime = get_datetime(f"{self.visit_date} {self.check_out_time}")
-			duration = check_out_datetime - check_in_datetime
-			self.duration_minutes = int(duration.total_seconds() / 60)
-
-	def on_submit(self):
-		"""Update member's visit statistics"""
-		self.update_member_visit_stats()
-
-	def update_member_visit_stats(self):
-		"""Update member's visit statistics"""
-		member = frappe.get_doc("Gym Member", self.member)
-		member.record_visit()
+			self.duration_minutes = get_duration_minutes(self.visit_date, self.check_in_time, self.check_out_time)
+		elif not self.check_out_time:
+			# A reopened visit has no duration until it is checked out again
+			self.duration_minutes = None
+
+	def after_insert(self):
+		"""Update live occupancy and counters for the new visit"""
+		on_visits_checked_in([self])
+
+	def on_update(self):
+		"""Update equipment usage, the daily rollup and the occupancy index"""
+		previous = self.get_doc_before_save()
+		equipment_usage.apply_visit_usage(self, previous)
+		
+		if not previous:
+			# after_insert has counted the check-in, a visit can be inserted already closed
+			if self.check_out_time:
+				on_visits_checked_out([self])
+			return
 		
-		# Update monthly visit count for membership plan validation
-		self.update_monthly_visit_count()
+		visit_rollup.apply_visit_change(self, previous)
+		if any(self.has_value_changed(f) for f in ("member", "visit_date", "check_in_time", "check_out_time")):
+			# Closing, reopening or moving a visit takes it out of the index and puts back the open one
+			if not previous.check_out_time:
+				remove_open_visits([previous])
+			add_open_visits([self])
 
-	def update_monthly_visit_count(self):
-		"""Update monthly visit count for membership plan validation"""
-		# This would be used to check against membership plan limits
-		# Implementation depends on how you want to track monthly visits
-		pass
+	def on_trash(self):
+		"""Drop the visit from the live occupancy index, daily rollup and equipment usage"""
+		remove_open_visits([self])
+		visit_rollup.remove_visits([self])
+		equipment_usage.apply_visit_usage(None, self)
 
 	def check_out(self, check_out_time=None):
 		"""Check out the member"""
@@ -69,28 +119,68 @@ class GymVisit(Document):
 		}
 
 
-@frappe.whitelist()
-def check_in_member(member_id, visit_type="Regular Workout", trainer=None):
-	"""Check in a member"""
-	# Validate member
-	member = frappe.get_doc("Gym Member", member_id)
-	if not member.is_membership_valid():
-		frappe.throw(_("Member's membership is not valid"))
-	
-	# Check if member is already checked in today
-	existing_visit = frappe.get_all(
+def on_visits_checked_in(visits):
+	"""Update derived visit data for newly created visits"""
+	add_open_visits(visits)
+	record_member_visits(visits)
+	record_monthly_visits(visits)
+	visit_rollup.add_check_ins(visits)
+
+
+def on_visits_checked_out(visits):
+	"""Update derived visit data for visits that were just closed"""
+	remove_open_visits(visits)
+	visit_rollup.add_check_outs(visits)
+
+
+def get_duration_minutes(visit_date, check_in_time, check_out_time):
+	"""Get the number of whole minutes between check-in and check-out on a date"""
+	check_in_datetime = get_datetime(f"{visit_date} {check_in_time}")
+	check_out_datetime = get_datetime(f"{visit_date} {check_out_time}")
+	duration = check_out_datetime - check_in_datetime
+	return int(duration.total_seconds() / 60)
+
+
+def get_open_visit(member_id, visit_date=None, for_update=False):
+	"""Get the name of the member's open visit for a date, if any"""
+	return frappe.db.get_value(
 		"Gym Visit",
-		filters={
+		{
 			"member": member_id,
-			"visit_date": today(),
+			"visit_date": visit_date or today(),
 			"check_out_time": ["is", "not set"]
-		}
+		},
+		"name",
+		for_update=for_update
 	)
+
+
+def check_in(member_id, visit_type="Regular Workout", trainer=None):
+	"""Check in a member within a single locked transaction
 	
-	if existing_visit:
-		frappe.throw(_("Member is already checked in today"))
+	The member row is locked so concurrent taps for the same member serialize,
+	only the membership columns are read and the new visit skips re-validating
+	the member on insert.
+	"""
+	# The occupancy index answers repeat taps without touching the database
+	if get_open_visit_entry(member_id, today()):
+		frappe.throw(_("Member is already checked in today"), AlreadyCheckedInError)
+	
+	member = get_membership(member_id, for_update=True)
+	if not member:
+		frappe.throw(_("Gym Member {0} not found").format(member_id), frappe.DoesNotExistError)
+	
+	if not membership_is_valid(member):
+		frappe.throw(_("Member's membership is not valid"), MembershipNotValidError)
+	
+	# Locking reads see rows committed while waiting on the member lock, which a plain
+	# read would miss once the transaction's snapshot was taken (e.g. by API key auth)
+	if get_open_visit(member_id, for_update=True):
+		frappe.throw(_("Member is already checked in today"), AlreadyCheckedInError)
+	
+	if not is_visit_allowed(member, for_update=True):
+		frappe.throw(_("Monthly visit limit of the membership plan has been reached"), VisitLimitReachedError)
 	
-	# Create new visit
 	visit = frappe.get_doc({
 		"doctype": "Gym Visit",
 		"member": member_id,
@@ -99,30 +189,226 @@ def check_in_member(member_id, visit_type="Regular Workout", trainer=None):
 		"visit_type": visit_type,
 		"trainer": trainer
 	})
+	visit.flags.membership_validated = True
 	visit.insert()
 	return visit
 
 
+@frappe.whitelist()
+def check_in_member(member_id, visit_type="Regular Workout", trainer=None):
+	"""Check in a member"""
+	return check_in(member_id, visit_type, trainer)
+
+
 @frappe.whitelist()
 def check_out_member(member_id):
 	"""Check out a member"""
-	# Find active visit
-	visit = frappe.get_all(
+	visit = get_open_visit(member_id)
+	if not visit:
+		frappe.throw(_("No active visit found for this member"))
+	
+	visit_doc = frappe.get_doc("Gym Visit", visit)
+	visit_doc.check_out()
+	return visit_doc
+
+
+@frappe.whitelist()
+def process_turnstile_events(events):
+	"""Check members in and out from a batch of buffered turnstile events
+	
+	Each event is a dict with ``member_id``, ``timestamp`` and ``direction``
+	("in" or "out"), or the same three values as a list. All members and their
+	open visits are loaded with one query each, new visits are bulk inserted and
+	check-outs are written with one bulk update. A result is returned for every
+	event, in input order, so a bad badge does not fail the batch.
+	"""
+	events = frappe.parse_json(events) or []
+	results = [None] * len(events)
+	parsed = []
+	
+	for idx, event in enumerate(events):
+		if isinstance(event, (list, tuple)) and len(event) == 3:
+			event = dict(zip(("member_id", "timestamp", "direction"), event, strict=True))
+		if not isinstance(event, dict):
+			results[idx] = {"status": "error", "message": _("Invalid event")}
+			continue
+		
+		result = results[idx] = {
+			"member_id": event.get("member_id"),
+			"timestamp": event.get("timestamp"),
+			"direction": event.get("direction")
+		}
+		direction = (event.get("direction") or "").lower()
+		if not event.get("member_id") or direction not in ("in", "out"):
+			result.update({"status": "error", "message": _("Invalid event")})
+			continue
+		
+		try:
+			timestamp = get_datetime(event.get("timestamp")) if event.get("timestamp") else now_datetime()
+		except Exception:
+			result.update({"status": "error", "message": _("Invalid timestamp")})
+			continue
+		
+		parsed.append((timestamp, idx, event["member_id"], direction))
+	
+	if not parsed:
+		return results
+	
+	parsed.sort()
+	member_ids = list({p[2] for p in parsed})
+	
+	members = {
+		m.name: m
+		for m in frappe.get_all(
+			"Gym Member",
+			filters={"name": ["in", member_ids]},
+			fields=MEMBERSHIP_FIELDS,
+			for_update=True
+		)
+	}
+	open_visits = {
+		(v.member, str(v.visit_date)): v
+		for v in frappe.get_all(
+			"Gym Visit",
+			filters={
+				"member": ["in", member_ids],
+				"visit_date": ["in", list({str(p[0].date()) for p in parsed})],
+				"check_out_time": ["is", "not set"]
+			},
+			fields=["name", "member", "visit_date", "check_in_time"],
+			for_update=True
+		)
+	}
+	
+	# Buffered uploads can cross a month boundary, so each event counts against its own month
+	monthly_visits = get_monthly_visit_counts(member_ids, {p[0].date() for p in parsed}, for_update=True)
+	new_visits = []
+	check_outs = {}
+	
+	for timestamp, idx, member_id, direction in parsed:
+		result = results[idx]
+		visit_date = str(timestamp.date())
+		month = get_first_day(timestamp.date())
+		event_time = timestamp.time()
+		open_visit = open_visits.get((member_id, visit_date))
+		
+		if direction == "in":
+			if member_id not in members:
+				result.update({"status": "error", "message": _("Gym Member {0} not found").format(member_id)})
+			elif not membership_is_valid(members[member_id]):
+				result.update({"status": "error", "message": _("Member's membership is not valid")})
+			elif open_visit:
+				result.update({"status": "error", "message": _("Member is already checked in today")})
+			elif not is_visit_allowed(members[member_id], monthly_visits.get((member_id, month), 0)):
+				result.update({"status": "error", "message": _("Monthly visit limit of the membership plan has been reached")})
+			else:
+				visit = frappe._dict(
+					name=make_autoname(VISIT_NAMING_SERIES, "Gym Visit"),
+					member=member_id,
+					visit_date=visit_date,
+					check_in_time=event_time,
+					check_out_time=None,
+					duration_minutes=None,
+					visit_type="Regular Workout"
+				)
+				new_visits.append(visit)
+				open_visits[(member_id, visit_date)] = visit
+				monthly_visits[(member_id, month)] = monthly_visits.get((member_id, month), 0) + 1
+				result.update({"status": "success", "message": _("Checked in"), "visit_id": visit.name})
+			continue
+		
+		if not open_visit:
+			result.update({"status": "error", "message": _("No active visit found for this member")})
+			continue
+		
+		if get_datetime(f"{visit_date} {event_time}") <= get_datetime(f"{visit_date} {open_visit.check_in_time}"):
+			result.update({"status": "error", "message": _("Check-out time must be after check-in time")})
+			continue
+		
+		duration = get_duration_minutes(visit_date, open_visit.check_in_time, event_time)
+		open_visit.check_out_time = event_time
+		open_visit.duration_minutes = duration
+		check_outs[open_visit.name] = open_visit
+		del open_visits[(member_id, visit_date)]
+		result.update({
+			"status": "success",
+			"message": _("Checked out"),
+			"visit_id": open_visit.name,
+			"visit_duration": duration
+		})
+	
+	new_names = {v.name for v in new_visits}
+	bulk_insert_docs(
+		"Gym Visit",
+		[
+			{
+				"name": v.name,
+				"naming_series": "GV-.YYYY.-",
+				"member": v.member,
+				"visit_date": v.visit_date,
+				"check_in_time": v.check_in_time,
+				"check_out_time": v.check_out_time,
+				"duration_minutes": v.duration_minutes,
+				"visit_type": v.visit_type
+			}
+			for v in new_visits
+		]
+	)
+	
+	updates = {
+		name: {"check_out_time": v.check_out_time, "duration_minutes": v.duration_minutes}
+		for name, v in check_outs.items()
+		if name not in new_names
+	}
+	if updates:
+		frappe.db.bulk_update("Gym Visit", updates)
+	
+	on_visits_checked_in(new_visits)
+	on_visits_checked_out(list(check_outs.values()))
+	return results
+
+
+def auto_check_out_stale_visits():
+	"""Close visits left open past the configured cutoff
+	
+	Stale visits are read with one projected query and closed with one batched
+	update, checking out at check-in plus the cutoff (or at the end of the visit
+	day if earlier) instead of loading and saving each visit.
+	"""
+	if not frappe.db.get_single_value("Gym Settings", "enable_auto_checkout"):
+		return 0
+	
+	cutoff = timedelta(hours=cint(frappe.db.get_single_value("Gym Settings", "auto_checkout_after_hours")) or 4)
+	now = now_datetime()
+	
+	visits = frappe.get_all(
 		"Gym Visit",
 		filters={
-			"member": member_id,
-			"visit_date": today(),
-			"check_out_time": ["is", "not set"]
+			"check_out_time": ["is", "not set"],
+			"visit_date": ["<=", (now - cutoff).date()]
 		},
-		limit=1
+		fields=["name", "member", "visit_date", "check_in_time", "visit_type"]
 	)
 	
-	if not visit:
-		frappe.throw(_("No active visit found for this member"))
+	closed = []
+	for visit in visits:
+		check_in = get_datetime(f"{visit.visit_date} {visit.check_in_time}")
+		if check_in + cutoff > now:
+			continue
+		
+		end_of_day = get_datetime(f"{visit.visit_date} 23:59:59")
+		visit.check_out_time = min(check_in + cutoff, end_of_day).time()
+		visit.duration_minutes = get_duration_minutes(visit.visit_date, visit.check_in_time, visit.check_out_time)
+		closed.append(visit)
 	
-	visit_doc = frappe.get_doc("Gym Visit", visit[0].name)
-	visit_doc.check_out()
-	return visit_doc
+	if closed:
+		frappe.db.bulk_update(
+			"Gym Visit",
+			{v.name: {"check_out_time": v.check_out_time, "duration_minutes": v.duration_minutes} for v in closed}
+		)
+		on_visits_checked_out(closed)
+	
+	return len(closed)
 
 
 @frappe.whitelist()
@@ -159,17 +445,21 @@ def get_visit_statistics(start_date=None, end_date=None):
 	if not end_date:
 		end_date = today()
 	
-	visits = frappe.get_all(
-		"Gym Visit",
-		filters={
-			"visit_date": ["between", [start_date, end_date]]
-		},
-		fields=["*"]
-	)
-	
-	total_visits = len(visits)
-	total_duration = sum(visit.duration_minutes or 0 for visit in visits)
-	unique_members = len(set(visit.member for visit in visits))
+	if getdate(start_date) == getdate(end_date) == getdate(today()):
+		visits = frappe.get_all(
+			"Gym Visit",
+			filters={"visit_date": start_date},
+			fields=["member", "duration_minutes"]
+		)
+		total_visits = len(visits)
+		total_duration = sum(visit.duration_minutes or 0 for visit in visits)
+		unique_members = len(set(visit.member for visit in visits))
+	else:
+		# Wider ranges read the daily rollup instead of every visit row
+		totals = visit_rollup.get_rollup_totals(start_date, end_date)
+		total_visits = totals.total_visits
+		total_duration = totals.total_duration_minutes
+		unique_members = visit_rollup.get_unique_member_count(start_date, end_date)
 	
 	return {
 		"total_visits": total_visits,
@@ -178,3 +468,9 @@ def get_visit_statistics(start_date=None, end_date=None):
 		"unique_members": unique_members,
 		"average_duration": total_duration / total_visits if total_visits > 0 else 0
 	}
+
+
+def on_doctype_update():
+	frappe.db.add_index("Gym Visit", ["member", "visit_date"])
+	# Covers the date range scan of get_unique_member_count
+	frappe.db.add_index("Gym Visit", ["visit_date", "member"])
@@ -0,0 +1,285 @@
+import frappe
+from frappe.model.document import Document
+from frappe.query_builder.functions import Count, Max, Min, Sum
+from frappe.utils import add_days, get_time, getdate, today
+
+from gms.utils import bulk_insert_docs, increment_counter
+
+
+class GymVisitDailyRollup(Document):
+	pass
+
+
+def get_rollup_key(visit_date, hour, visit_type):
+	return f"{visit_date}-{int(hour):02d}-{visit_type}"
+
+
+def _rollup_values(visit_date, hour, visit_type):
+	return {
+		"rollup_key": get_rollup_key(visit_date, hour, visit_type),
+		"visit_date": visit_date,
+		"hour": hour,
+		"visit_type": visit_type
+	}
+
+
+def _visit_dimensions(visit):
+	return str(visit.visit_date), get_time(visit.check_in_time).hour, visit.visit_type or "Regular Workout"
+
+
+def add_check_ins(visits):
+	"""Count new visits in the daily rollup
+	
+	A member counts as unique in the bucket of their first visit of the day, so
+	summing ``unique_members`` over a date gives that day's unique visitors.
+	"""
+	if not visits:
+		return
+	
+	names = [v.name for v in visits]
+	seen = {
+		(v.member, str(v.visit_date))
+		for v in frappe.get_all(
+			"Gym Visit",
+			filters={
+				"member": ["in", list({v.member for v in visits})],
+				"visit_date": ["in", list({str(v.visit_date) for v in visits})],
+				"name": ["not in", names]
+			},
+			fields=["member", "visit_date"]
+		)
+	}
+	
+	increments = {}
+	for visit in sorted(visits, key=lambda v: (str(v.visit_date), get_time(v.check_in_time))):
+		dimensions = _visit_dimensions(visit)
+		counts = increments.setdefault(dimensions, {"visit_count": 0, "unique_members": 0})
+		counts["visit_count"] += 1
+		if (visit.member, dimensions[0]) not in seen:
+			seen.add((visit.member, dimensions[0]))
+			counts["unique_members"] += 1
+	
+	_apply(increments)
+
+
+def add_check_outs(visits):
+	"""Add completed visits and their durations to the daily rollup"""
+	increments = {}
+	for visit in visits:
+		counts = increments.setdefault(
+			_visit_dimensions(visit), {"completed_visits": 0, "total_duration_minutes": 0}
+		)
+		counts["completed_visits"] += 1
+		counts["total_duration_minutes"] += visit.duration_minutes or 0
+	
+	_apply(increments)
+
+
+def remove_visits(visits):
+	"""Take deleted visits out of the daily rollup
+	
+	When a member's first visit of a day goes, their unique count moves to the
+	bucket of their next remaining visit that day.
+	"""
+	if not visits:
+		return
+	
+	names = [v.name for v in visits]
+	remaining = {}
+	for v in frappe.get_all(
+		"Gym Visit",
+		filters={
+			"member": ["in", list({v.member for v in visits})],
+			"visit_date": ["in", list({str(v.visit_date) for v in visits})],
+			"name": ["not in", names]
+		},
+		fields=["name", "member", "visit_date", "check_in_time", "visit_type"]
+	):
+		remaining.setdefault((v.member, str(v.visit_date)), []).append(v)
+	
+	def first_visit(day_visits):
+		return min(day_visits, key=lambda v: (get_time(v.check_in_time), v.name))
+	
+	increments = {}
+	
+	def add(visit, field, value):
+		counts = increments.setdefault(_visit_dimensions(visit), {})
+		counts[field] = counts.get(field, 0) + value
+	
+	removed = {}
+	for visit in visits:
+		add(visit, "visit_count", -1)
+		if visit.check_out_time:
+			add(visit, "completed_visits", -1)
+			add(visit, "total_duration_minutes", -(visit.duration_minutes or 0))
+		removed.setdefault((visit.member, str(visit.visit_date)), []).append(visit)
+	
+	for key, day_visits in removed.items():
+		others = remaining.get(key)
+		first = first_visit(day_visits + (others or []))
+		if first.name in names:
+			add(first, "unique_members", -1)
+			if others:
+				add(first_visit(others), "unique_members", 1)
+	
+	_apply(increments)
+
+
+def apply_visit_change(visit, previous):
+	"""Apply the change of a saved visit to the rollup
+	
+	``previous`` is the visit as it was before the save. A visit that moved to
+	another member, date, hour or visit type is taken out of its old bucket and
+	counted again in the new one.
+	"""
+	if previous.member != visit.member or _visit_dimensions(previous) != _visit_dimensions(visit):
+		remove_visits([previous])
+		add_check_ins([visit])
+		add_check_outs([visit] if visit.check_out_time else [])
+		return
+	
+	before, after = _completed_visit(previous), _completed_visit(visit)
+	counts = {
+		"completed_visits": after[0] - before[0],
+		"total_duration_minutes": after[1] - before[1]
+	}
+	if any(counts.values()):
+		_apply({_visit_dimensions(visit): counts})
+
+
+def _completed_visit(visit):
+	"""Get [completed visits, duration] a visit contributes to its bucket"""
+	return [1, visit.duration_minutes or 0] if visit.check_out_time else [0, 0]
+
+
+def _apply(increments):
+	for (visit_date, hour, visit_type), counts in increments.items():
+		increment_counter(
+			"Gym Visit Daily Rollup",
+			get_rollup_key(visit_date, hour, visit_type),
+			counts,
+			_rollup_values(visit_date, hour, visit_type)
+		)
+
+
+def rebuild_visit_rollups(start_date=None, end_date=None, chunk_days=31):
+	"""Rebuild the daily rollup from Gym Visit for a date range
+	
+	Run with ``bench execute gms.gms.doctype.gym_visit_daily_rollup.gym_visit_daily_rollup.rebuild_visit_rollups``
+	to backfill. Defaults to the full range of recorded visits and works through
+	it a month at a time so memory stays bounded.
+	"""
+	if not start_date or not end_date:
+		Visit = frappe.qb.DocType("Gym Visit")
+		bounds = frappe.qb.from_(Visit).select(Min(Visit.visit_date), Max(Visit.visit_date)).run()
+		if not bounds or not bounds[0][0]:
+			return 0
+		start_date = start_date or bounds[0][0]
+		end_date = end_date or bounds[0][1]
+	
+	rebuilt = 0
+	chunk_start = getdate(start_date)
+	end_date = getdate(end_date)
+	while chunk_start <= end_date:
+		chunk_end = min(getdate(add_days(chunk_start, chunk_days - 1)), end_date)
+		rebuilt += _rebuild_chunk(chunk_start, chunk_end)
+		frappe.db.commit()
+		chunk_start = getdate(add_days(chunk_end, 1))
+	
+	return rebuilt
+
+
+def _rebuild_chunk(start_date, end_date):
+	visits = frappe.get_all(
+		"Gym Visit",
+		filters={"visit_date": ["between", [start_date, end_date]]},
+		fields=["member", "visit_date", "check_in_time", "check_out_time", "duration_minutes", "visit_type"],
+		order_by="visit_date asc, check_in_time asc"
+	)
+	
+	rows = {}
+	seen = set()
+	for visit in visits:
+		dimensions = _visit_dimensions(visit)
+		row = rows.get(dimensions)
+		if not row:
+			row = rows[dimensions] = {
+				"name": get_rollup_key(*dimensions),
+				**_rollup_values(*dimensions),
+				"visit_count": 0,
+				"unique_members": 0,
+				"completed_visits": 0,
+				"total_duration_minutes": 0
+			}
+		
+		row["visit_count"] += 1
+		if (visit.member, dimensions[0]) not in seen:
+			seen.add((visit.member, dimensions[0]))
+			row["unique_members"] += 1
+		if visit.check_out_time:
+			row["completed_visits"] += 1
+			row["total_duration_minutes"] += visit.duration_minutes or 0
+	
+	frappe.db.delete("Gym Visit Daily Rollup", {"visit_date": ["between", [start_date, end_date]]})
+	bulk_insert_docs("Gym Visit Daily Rollup", list(rows.values()))
+	return len(rows)
+
+
+def get_rollup_totals(start_date, end_date):
+	"""Sum the rollup over a date range"""
+	Rollup = frappe.qb.DocType("Gym Visit Daily Rollup")
+	totals = (
+		frappe.qb.from_(Rollup)
+		.select(
+			Sum(Rollup.visit_count).as_("total_visits"),
+			Sum(Rollup.completed_visits).as_("completed_visits"),
+			Sum(Rollup.total_duration_minutes).as_("total_duration_minutes")
+		)
+		.where(Rollup.visit_date.between(getdate(start_date), getdate(end_date)))
+	).run(as_dict=True)[0]
+	
+	return frappe._dict({k: int(v or 0) for k, v in totals.items()})
+
+
+def get_unique_member_count(start_date, end_date):
+	"""Count distinct visitors over a date range with a single aggregate query
+	
+	Distinct members cannot be summed from daily rows, so this still reads one
+	index entry per visit in the range. The (visit_date, member) index makes it
+	an index-only range scan, which grows with the range's visits but never
+	touches the visit rows.
+	"""
+	Visit = frappe.qb.DocType("Gym Visit")
+	return (
+		frappe.qb.from_(Visit)
+		.select(Count(Visit.member).distinct())
+		.where(Visit.visit_date.between(getdate(start_date), getdate(end_date)))
+	).run()[0][0]
+
+
+@frappe.whitelist()
+def get_daily_visit_series(start_date=None, end_date=None, group_by=None):
+	"""Get visit totals per day, optionally split by visit_type or hour"""
+	if not start_date:
+		start_date = add_days(today(), -29)
+	if not end_date:
+		end_date = today()
+	
+	Rollup = frappe.qb.DocType("Gym Visit Daily Rollup")
+	dimensions = [Rollup.visit_date]
+	if group_by in ("visit_type", "hour"):
+		dimensions.append(Rollup[group_by])
+	
+	return (
+		frappe.qb.from_(Rollup)
+		.select(
+			*dimensions,
+			Sum(Rollup.visit_count).as_("visits"),
+			Sum(Rollup.unique_members).as_("unique_members"),
+			Sum(Rollup.completed_visits).as_("completed_visits"),
+			Sum(Rollup.total_duration_minutes).as_("total_duration_minutes")
+		)
+		.where(Rollup.visit_date.between(getdate(start_date), getdate(end_date)))
+		.groupby(*dimensions)
+		.orderby(*dimensions)
+	).run(as_dict=True)
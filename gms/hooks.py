@@ -83,7 +83,7 @@ app_license = "mit"
 # ------------
 
 # before_install = "gms.install.before_install"
-# after_install = "gms.install.after_install"
+after_install = "gms.install.after_install"
 
 # Uninstallation
 # ------------
@@ -148,23 +148,21 @@ app_license = "mit"
 # Scheduled Tasks
 # ---------------
 
-# scheduler_events = {
-# 	"all": [
-# 		"gms.tasks.all"
-# 	],
-# 	"daily": [
-# 		"gms.tasks.daily"
-# 	],
-# 	"hourly": [
-# 		"gms.tasks.hourly"
-# 	],
-# 	"weekly": [
-# 		"gms.tasks.weekly"
-# 	],
-# 	"monthly": [
-# 		"gms.tasks.monthly"
-# 	],
-# }
+scheduler_events = {
+	"all": [
+		"gms.gms.doctype.gym_booking_request.gym_booking_request.process_pending_booking_requests"
+	],
+	"hourly": [
+		"gms.gms.doctype.gym_visit.gym_visit.auto_check_out_stale_visits",
+		"gms.gms.doctype.gym_class_booking.gym_class_booking.finalize_class_attendance"
+	],
+	"daily": [
+		"gms.gms.doctype.gym_member.gym_member.reconcile_member_visit_counters",
+		"gms.gms.doctype.gym_member_monthly_visit.gym_member_monthly_visit.rebuild_monthly_visit_counts",
+		"gms.gms.doctype.gym_class_slot.gym_class_slot.generate_class_slots",
+		"gms.gms.doctype.gym_class.gym_class.warm_class_availability_cache"
+	],
+}
 
 # Testing
 # -------
@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_settings.gym_settings import set_default_settings
+
+
+def after_install():
+	# Patches are marked as run on install, so settings defaults are stored here too
+	set_default_settings()
@@ -0,0 +1,21 @@
+import frappe
+from frappe.utils import today
+
+from gms.gms.doctype.gym_class_slot.gym_class_slot import SEAT_HOLDING_STATUSES, get_slot
+
+
+def execute():
+	"""Create seat counters for upcoming class slots that already have bookings"""
+	slots = frappe.get_all(
+		"Gym Class Booking",
+		filters={
+			"class_date": [">=", today()],
+			"status": ["in", SEAT_HOLDING_STATUSES],
+			"class_slot": ["is", "not set"]
+		},
+		fields=["gym_class", "class_date", "class_time"],
+		distinct=True
+	)
+	
+	for slot in slots:
+		get_slot(slot.gym_class, slot.class_date, slot.class_time)
@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_class_slot.gym_class_slot import generate_class_slots
+
+
+def execute():
+	"""Generate the class calendar ahead from the existing class schedules"""
+	generate_class_slots()
@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_class_revenue_rollup.gym_class_revenue_rollup import rebuild_revenue_rollups
+
+
+def execute():
+	"""Backfill the class revenue rollup from existing bookings"""
+	rebuild_revenue_rollups()
@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_equipment_usage_rollup.gym_equipment_usage_rollup import rebuild_equipment_usage
+
+
+def execute():
+	"""Backfill the equipment usage rollup from existing visits"""
+	rebuild_equipment_usage()
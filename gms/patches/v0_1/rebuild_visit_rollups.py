@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_visit_daily_rollup.gym_visit_daily_rollup import rebuild_visit_rollups
+
+
+def execute():
+	"""Backfill the daily visit rollup from existing visits"""
+	rebuild_visit_rollups()
@@ -0,0 +1,6 @@
+from gms.gms.doctype.gym_settings.gym_settings import set_default_settings
+
+
+def execute():
+	"""Store the defaults of Gym Settings fields that have never been saved"""
+	set_default_settings()
@@ -0,0 +1,42 @@
+import frappe
+from frappe.query_builder.functions import IfNull
+from frappe.utils import now_datetime
+
+
+def increment_counter(doctype, name, increments, values=None):
+	"""Add ``increments`` to the numeric columns of a counter row, creating it if missing
+	
+	Counter doctypes are named by a key field, so ``values`` must include that key
+	with ``name`` as its value. The increment is a single in-place column update,
+	which keeps concurrent writers from losing counts, and a concurrent first
+	insert of the same row falls back to the update.
+	"""
+	if not frappe.db.exists(doctype, name):
+		frappe.db.savepoint("gms_counter")
+		try:
+			frappe.get_doc({"doctype": doctype, **(values or {}), **increments}).insert(ignore_permissions=True)
+			return
+		except frappe.DuplicateEntryError:
+			frappe.db.rollback(save_point="gms_counter")
+			frappe.clear_last_message()
+	
+	table = frappe.qb.DocType(doctype)
+	query = frappe.qb.update(table).set(table.modified, now_datetime()).where(table.name == name)
+	for field, delta in increments.items():
+		query = query.set(table[field], IfNull(table[field], 0) + delta)
+	query.run()
+
+
+def bulk_insert_docs(doctype, rows):
+	"""Insert plain row dicts into a doctype table in one statement, skipping controllers"""
+	if not rows:
+		return
+	
+	now = now_datetime()
+	user = frappe.session.user
+	fields = list(rows[0])
+	frappe.db.bulk_insert(
+		doctype,
+		["owner", "modified_by", "creation", "modified", "docstatus", "idx", *fields],
+		[(user, user, now, now, 0, 0, *(row[f] for f in fields)) for row in rows]
+	)